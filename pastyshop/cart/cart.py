@@ -5,14 +5,39 @@ from shop.models import Product
 from couponsapp.models import Coupon
 
 
+class CartLine:
+    """
+    A product of the cart with its quantity and the price it was added at.
+    Lines are made from the session data every time the cart is iterated
+    and can't be changed, the session only holds ids, quantities and
+    prices as strings.
+    """
+
+    __slots__ = ("product", "quantity", "price")
+
+    def __init__(self, product, quantity, price):
+        object.__setattr__(self, "product", product)
+        object.__setattr__(self, "quantity", quantity)
+        object.__setattr__(self, "price", price)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"<CartLine {self.quantity} x {self.product.id}>"
+
+    @property
+    def total_price(self):
+        return self.price * self.quantity
+
+
 class Cart:
     def __init__(self, request):
+        self.request = request
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            # зберігаємо порожній словник в сесії користувача
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        # an empty cart is not stored until something is added, so
+        # visitors who only browse don't get a session
+        self.cart = self.session.get(settings.CART_SESSION_ID) or {}
         # store current applied coupon
         self.coupon_id = self.session.get("coupon_id")
 
@@ -74,25 +99,53 @@ class Cart:
             del self.cart[product_id]
             self.save()
 
+    def get_products(self):
+        """
+        The get_products function loads the products of the cart with
+        their translations. The products are remembered on the request,
+        so the carts of the view, the templates and the context processor
+        share a single query, and only products added since are loaded.
+        Products that no longer exist are removed from the cart, so its
+        summary matches the lines.
+
+        :param self: Access the attributes and methods of the class
+        :return: A dictionary of product id to product, None for products
+            that no longer exist
+        """
+        products = getattr(self.request, "_cart_products", None)
+        if products is None:
+            products = self.request._cart_products = {}
+        missing = [int(id) for id in self.cart if int(id) not in products]
+        if missing:
+            found = Product.objects.prefetch_translations().in_bulk(missing)
+            for id in missing:
+                products[id] = found.get(id)
+        vanished = [id for id in self.cart if products[int(id)] is None]
+        if vanished:
+            for id in vanished:
+                del self.cart[id]
+            self.save()
+        return products
+
     def __iter__(self):
         """
         The __iter__ function is a special function that allows you to iterate over the items in an object.
         In this case, we are using it to iterate over the items in our cart.
         The __iter__ function returns an iterator object which can be used by Python's
         for loops and other functions that expect an iterator.
+        Every item is yielded as a CartLine, the session keeps only the data.
 
         :param self: Access the attributes and methods of the class
         :return: An iterable object that can be looped over
         :doc-author: Ihor Voitiuk
         """
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        for product in products:
-            self.cart[str(product.id)]["product"] = product
-        for item in self.cart.values():
-            item["price"] = Decimal(item["price"])
-            item["total_price"] = item["price"] * item["quantity"]
-            yield item
+        products = self.get_products()
+        for product_id, item in self.cart.items():
+            yield CartLine(
+                products[int(product_id)],
+                item["quantity"],
+                Decimal(item["price"]),
+            )
 
     def __len__(self):
         """
@@ -104,7 +157,7 @@ class Cart:
         :return: The total number of items in the cart
         :doc-author: Ihor Voitiuk
         """
-        return sum(item["quantity"] for item in self.cart.values())
+        return self.get_summary()["count"]
 
     def get_total_price(self):
         """
@@ -116,22 +169,53 @@ class Cart:
         :return: The total price of the items in the cart
         :doc-author: Ihor Voitiuk
         """
-        return sum(
-            Decimal(item["price"]) * item["quantity"]
-            for item in self.cart.values()
-        )
+        return Decimal(self.get_summary()["total"])
+
+    def summarize(self):
+        """
+        The summarize function counts the items of the cart and adds up
+        their prices.
+
+        :param self: Represent the instance of the object itself
+        :return: A dictionary with the count and the total as a string,
+            so it can be stored in the session
+        """
+        return {
+            "count": sum(item["quantity"] for item in self.cart.values()),
+            "total": str(
+                sum(
+                    Decimal(item["price"]) * item["quantity"]
+                    for item in self.cart.values()
+                )
+            ),
+        }
+
+    def get_summary(self):
+        """
+        The get_summary function returns the item count and the total price
+        kept in the session by save, so the header of every page shows
+        them without walking the cart. Sessions saved before the summary
+        existed get it computed.
+
+        :param self: Represent the instance of the object itself
+        :return: A dictionary with the count and the total as a string
+        """
+        summary = self.session.get(settings.CART_SUMMARY_SESSION_ID)
+        if summary is None:
+            summary = self.summarize()
+        return summary
 
     def clear(self):
         """
         The clear function deletes the cart from the user's session.
-        It does this by deleting the CART_SESSION_ID key from self.session, and then setting self.session to modified.
+        It does this by popping the CART_SESSION_ID key from self.session, which marks the session as modified when the cart was stored.
 
         :param self: Represent the instance of the object itself
         :return: Nothing
         :doc-author: Ihor Voitiuk
         """
-        del self.session[settings.CART_SESSION_ID]
-        self.session.modified = True
+        self.session.pop(settings.CART_SESSION_ID, None)
+        self.session.pop(settings.CART_SUMMARY_SESSION_ID, None)
 
     def save(self):
         """
@@ -145,6 +229,7 @@ class Cart:
         """
         # зберігає корзину в сесії користувача
         self.session[settings.CART_SESSION_ID] = self.cart
+        self.session[settings.CART_SUMMARY_SESSION_ID] = self.summarize()
         # позначаємо сесію як змінену
         self.session.modified = True
 
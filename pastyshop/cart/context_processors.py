@@ -1,5 +1,9 @@
+from django.utils.functional import SimpleLazyObject
+
 from .cart import Cart
 
 
 def cart(request):
-    return {"cart": Cart(request)}
+    # made only when a template uses it, the header reads the summary
+    # kept in the session instead of walking the cart
+    return {"cart": SimpleLazyObject(lambda: Cart(request))}
@@ -1,7 +1,18 @@
-from django.test import TestCase, Client
+import copy
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.sessions.backends.db import SessionStore
+from shop.models import Product
 from .cart import Cart
+from .context_processors import cart as cart_context
 from .forms import CartAddProductForm
 
 from authentication.models import CustomUser
@@ -76,3 +87,158 @@ class CartTestCase(TestCase):
 
         self.assertEqual(len(cart), initial_cart_count - 1)
         self.assertFalse(any(item["product"] == self.product for item in cart))
+
+
+class CartLinesTestCase(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f"Product {i}", slug=f"p-{i}", price=i)
+            for i in range(1, 4)
+        ]
+        for product in self.products:
+            self.client.post(
+                reverse("cart:cart_add", args=[product.id]),
+                {"quantity": 2, "override": False},
+            )
+        self.request = RequestFactory().get("/")
+        self.request.session = self.client.session
+        self.request.session.keys()
+
+    def test_products_are_loaded_once_per_request(self):
+        with self.assertNumQueries(2):
+            lines = list(Cart(self.request))
+            again = list(Cart(self.request))
+        self.assertEqual(
+            [line.product for line in again],
+            [line.product for line in lines],
+        )
+        self.assertEqual([line.product for line in lines], self.products)
+        self.assertEqual(lines[2].total_price, Decimal("6.00"))
+
+    def test_session_is_not_changed(self):
+        data = copy.deepcopy(dict(self.request.session))
+        lines = list(Cart(self.request))
+        with self.assertRaises(AttributeError):
+            lines[0].quantity = 5
+        self.assertEqual(dict(self.request.session), data)
+        self.assertEqual(
+            data["cart"][str(self.products[0].id)],
+            {"quantity": 2, "price": "1.00"},
+        )
+        json.dumps(data)
+
+    @mock.patch("cart.views.Recommender.suggest_products_for", return_value=[])
+    def test_update_quantity_forms(self, suggest_products_for):
+        response = self.client.get(reverse("cart:cart_detail"))
+        lines = response.context["lines"]
+        self.assertEqual([item.product for item, _ in lines], self.products)
+        self.assertEqual(
+            lines[0][1].initial, {"quantity": 2, "override": True}
+        )
+        self.assertContains(response, 'name="quantity"', count=3)
+
+    def test_deleted_product_is_removed(self):
+        self.products[0].delete()
+        cart = Cart(self.request)
+        lines = list(cart)
+        self.assertEqual([line.product for line in lines], self.products[1:])
+        self.assertEqual(len(cart), 4)
+        self.assertEqual(
+            cart.get_total_price(), sum(line.total_price for line in lines)
+        )
+        self.assertNotIn(
+            str(self.products[0].id), self.request.session["cart"]
+        )
+        self.assertEqual(
+            self.request.session["cart_summary"],
+            {"count": 4, "total": "10.00"},
+        )
+
+    def test_summary_follows_the_cart(self):
+        cart = Cart(self.request)
+        self.assertEqual(
+            self.request.session["cart_summary"],
+            {"count": 6, "total": "12.00"},
+        )
+        cart.update(self.products[2], 1)
+        cart.remove(self.products[0])
+        cart.add(self.products[1], 1)
+        self.assertEqual(
+            self.request.session["cart_summary"],
+            {"count": 4, "total": "9.00"},
+        )
+        self.assertEqual(len(cart), 4)
+        self.assertEqual(cart.get_total_price(), Decimal("9.00"))
+        cart.clear()
+        self.assertNotIn("cart_summary", self.request.session)
+        self.assertEqual(len(Cart(self.request)), 0)
+
+    def test_summary_of_an_older_session(self):
+        del self.request.session["cart_summary"]
+        cart = Cart(self.request)
+        self.assertEqual(len(cart), 6)
+        self.assertEqual(cart.get_total_price(), Decimal("12.00"))
+
+    def test_context_processor_is_lazy(self):
+        with mock.patch("cart.context_processors.Cart") as cart_class:
+            context = cart_context(self.request)
+            cart_class.assert_not_called()
+            len(context["cart"])
+            cart_class.assert_called_once_with(self.request)
+
+
+@mock.patch("shop.views.Recommender.suggest_products_for", return_value=[])
+@mock.patch("cart.views.Recommender.suggest_products_for", return_value=[])
+class AnonymousSessionTestCase(TestCase):
+    """
+    Crawlers don't keep cookies, so every page view of an anonymous
+    visitor starts without a session.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.products = [
+            Product.objects.create(name=f"Product {i}", slug=f"p-{i}", price=i)
+            for i in range(1, 6)
+        ]
+        self.pages = [
+            reverse("main:main_page"),
+            reverse("shop:product_list"),
+            reverse("cart:cart_detail"),
+        ] + [product.get_absolute_url() for product in self.products]
+
+    def count_session_writes(self, client, urls):
+        with CaptureQueriesContext(connection) as queries:
+            for url in urls:
+                self.assertEqual(client.get(url).status_code, 200)
+        return sum(
+            query["sql"].startswith(("INSERT", "UPDATE"))
+            and "django_session" in query["sql"]
+            for query in queries.captured_queries
+        )
+
+    def test_page_views_write_no_session(self, *mocks):
+        views = 0
+        for _ in range(20):
+            writes = self.count_session_writes(Client(), self.pages)
+            self.assertEqual(writes, 0)
+            views += len(self.pages)
+        self.assertEqual(views, 160)
+        self.assertFalse(Session.objects.exists())
+
+    def test_session_is_created_on_first_add(self, *mocks):
+        client = Client()
+        self.count_session_writes(client, self.pages)
+        client.post(
+            reverse("cart:cart_add", args=[self.products[0].id]),
+            {"quantity": 1, "override": False},
+        )
+        self.assertEqual(Session.objects.count(), 1)
+        # the pages read the stored cart without saving it again
+        self.assertEqual(self.count_session_writes(client, self.pages), 0)
+        self.assertContains(client.get(self.pages[0]), "1 item, UAH 1,00")
+
+    def test_removing_from_an_empty_cart(self, *mocks):
+        client = Client()
+        client.post(reverse("cart:cart_remove", args=[self.products[0].id]))
+        self.assertFalse(Session.objects.exists())
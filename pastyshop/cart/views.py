@@ -1,10 +1,10 @@
-import random
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 
 from couponsapp.forms import CouponApplyForm
 from shop.models import Product
 from shop.recommender import Recommender
+from shop.showcase import Showcase
 from .cart import Cart
 from .forms import CartAddProductForm
 
@@ -65,22 +65,31 @@ def cart_detail(request):
     :return: A dictionary with two keys: cart and coupon_apply_form
     """
     cart = Cart(request)
-    for item in cart:
-        item["update_quantity_form"] = CartAddProductForm(
-            initial={"quantity": item["quantity"], "override": True}
-        )
     coupon_apply_form = CouponApplyForm()
 
+    # a form to update the quantity of every line
+    lines = [
+        (
+            item,
+            CartAddProductForm(
+                initial={"quantity": item.quantity, "override": True}
+            ),
+        )
+        for item in cart
+    ]
+
     r = Recommender()
-    cart_products = [item["product"] for item in cart]
+    cart_products = [item.product for item, _ in lines]
+    recommended_products = []
     if cart_products:
         recommended_products = r.suggest_products_for(
             cart_products, max_results=4
         )
-    else:
-        all_products = Product.objects.filter(available=True)
-        recommended_products = random.sample(
-            list(all_products), min(len(all_products), 4)
+    if not recommended_products:
+        recommended_products = Showcase().sample_bestsellers(
+            request.LANGUAGE_CODE,
+            4,
+            exclude=[product.id for product in cart_products],
         )
 
     return render(
@@ -88,6 +97,7 @@ def cart_detail(request):
         "cart/detail.html",
         {
             "cart": cart,
+            "lines": lines,
             "coupon_apply_form": coupon_apply_form,
             "recommended_products": recommended_products,
         },
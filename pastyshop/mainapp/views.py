@@ -1,6 +1,6 @@
 from django.shortcuts import render
 
-from shop.models import Product
+from shop.showcase import Showcase
 
 
 def main_page(request):
@@ -11,9 +11,7 @@ def main_page(request):
     :param request: Pass the request object to the view
     :return: The main
     """
-    products = (
-        Product.objects.filter(available=True).order_by("?").distinct()[:4]
-    )
+    products = Showcase().sample(request.LANGUAGE_CODE, 4)
 
     return render(request, "mainapp/main.html", {"products": products})
 
@@ -37,9 +37,9 @@ def order_create(request):
             for item in cart:
                 OrderItem.objects.create(
                     order=order,
-                    product=item["product"],
-                    price=item["price"],
-                    quantity=item["quantity"],
+                    product=item.product,
+                    price=item.price,
+                    quantity=item.quantity,
                 )
             # clear the cart
             cart.clear()
@@ -194,6 +194,43 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CART_SESSION_ID = "cart"
 
+# Item count and total of the cart kept next to it in the session for the
+# header of every page, updated whenever the cart is saved
+CART_SUMMARY_SESSION_ID = "cart_summary"
+
+# Postgres text search configuration of each language, mirrored by
+# the search vector trigger of shop.0006 (there is no Ukrainian stemmer)
+SEARCH_CONFIGS = {
+    "uk": "simple",
+    "en": "english",
+}
+
+# Product search engine, shop.search.memory.InMemorySearchBackend
+# keeps an inverted index in the memory of every process instead
+SEARCH_BACKEND = "shop.search.postgres.PostgresSearchBackend"
+
+# Number of results of the header search box
+SEARCH_TOP_RESULTS = 5
+
+# Search results beyond this rank are dropped
+SEARCH_MAX_RESULTS = 1000
+
+# Ranked search results are cached for this many seconds (0 disables),
+# a cache miss is computed once while other requests wait up to
+# SEARCH_CACHE_LOCK_TIMEOUT seconds for it
+SEARCH_CACHE_TIMEOUT = 60 * 10
+SEARCH_CACHE_LOCK_TIMEOUT = 5
+
+# Shuffled product id pools are reshuffled after this many seconds
+SHOWCASE_POOL_TIMEOUT = 60 * 15
+
+# Bestsellers of the last BESTSELLERS_DAYS days, at most
+# BESTSELLERS_POOL_SIZE ids per category, are ranked by the hourly
+# build_bestsellers task and shown when there is nothing to recommend
+BESTSELLERS_DAYS = 90
+BESTSELLERS_POOL_SIZE = 100
+BESTSELLERS_TIMEOUT = 60 * 60 * 2
+
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = env("EMAIL_HOST")
 EMAIL_PORT = env("EMAIL_PORT")
@@ -215,6 +252,96 @@ REDIS_HOST = env("REDIS_HOST")
 REDIS_PORT = env("REDIS_PORT")
 REDIS_DB = env("REDIS_DB")
 
+# The cache is shared by the web and the Celery processes, the bestsellers,
+# the showcase pools, the search results and the similar products model are
+# built in one process and read in the others. It has its own database,
+# clearing it does not drop the co-purchase scores
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": (
+            f"redis://{REDIS_HOST}:{REDIS_PORT}/"
+            f"{env('REDIS_CACHE_DB', default=1)}"
+        ),
+    }
+}
+
+# Storage of the co-purchase scores, shop.purchases.memory.InMemoryPurchaseStorage
+# keeps them in the memory of the process for single-node deployments and
+# shop.purchases.sharded.ShardedRedisPurchaseStorage spreads them over the
+# Redis urls of RECOMMENDER_REDIS_NODES, run rebalance_recommendations
+# after adding a node
+RECOMMENDER_STORAGE = "shop.purchases.redis.RedisPurchaseStorage"
+RECOMMENDER_REDIS_NODES = env.list("RECOMMENDER_REDIS_NODES", default=[])
+
+# Paid orders are remembered for this many seconds, so the co-purchase
+# scores of an order are not counted twice when Stripe retries a webhook
+RECOMMENDER_ORDER_TIMEOUT = 60 * 60 * 24 * 30
+
+# Extra recommendations read from Redis to make up for unavailable products
+RECOMMENDER_OVERFETCH = 4
+
+# Recommendations cached in the memory of each process, at most this many
+# entries for at most this many seconds
+RECOMMENDER_CACHE_SIZE = 1000
+RECOMMENDER_CACHE_TIMEOUT = 60 * 5
+
+# Co-purchase scores kept per product, the lowest scores are dropped by
+# trim_purchases and by rebuild_recommendations. Recording an order keeps
+# twice as many, so new pairs have room to collect a score
+RECOMMENDER_TOP_K = 100
+
+# Co-purchase scores halve every RECOMMENDER_HALF_LIFE seconds when set,
+# e.g. 60 * 60 * 24 * 60, so seasonal products fade out of the
+# recommendations, scores below RECOMMENDER_MIN_SCORE are then dropped
+RECOMMENDER_HALF_LIFE = None
+RECOMMENDER_MIN_SCORE = 0.1
+
+# Redis calls of the recommender time out after this many seconds, after
+# RECOMMENDER_BREAKER_THRESHOLD failures in a row the recommendations are
+# read from the Postgres snapshot for RECOMMENDER_BREAKER_TIMEOUT seconds
+RECOMMENDER_REDIS_TIMEOUT = 0.5
+RECOMMENDER_BREAKER_THRESHOLD = 5
+RECOMMENDER_BREAKER_TIMEOUT = 30
+
+# Recommendations per product copied into the snapshot
+RECOMMENDER_SNAPSHOT_SIZE = 20
+
+# Products similar by name, description and category kept per product,
+# they fill the recommendations of products with few co-purchases
+SIMILAR_PRODUCTS_TOP_K = 20
+SIMILAR_PRODUCTS_MIN_SCORE = 0.05
+# The similar products of a saved product are refreshed after this many
+# seconds, the saves made in the meantime are refreshed together
+SIMILAR_PRODUCTS_UPDATE_DELAY = 60
+
+CELERY_BEAT_SCHEDULE = {
+    "decay-purchases": {
+        "task": "shop.tasks.decay_purchases",
+        "schedule": 60 * 60 * 24,
+    },
+    "trim-purchases": {
+        "task": "shop.tasks.trim_purchases",
+        "schedule": 60 * 60 * 24,
+    },
+    "snapshot-recommendations": {
+        "task": "shop.tasks.snapshot_recommendations",
+        "schedule": 60 * 60,
+    },
+    "rebuild-similar-products": {
+        "task": "shop.tasks.rebuild_similar_products",
+        "schedule": 60 * 60 * 24,
+    },
+    "build-bestsellers": {
+        "task": "shop.tasks.build_bestsellers",
+        "schedule": 60 * 60,
+    },
+    "recount-comments": {
+        "task": "shop.tasks.recount_comments",
+        "schedule": 60 * 60 * 24,
+    },
+}
+
 CLOUDINARY_STORAGE = {
     "CLOUD_NAME": env("CLOUDINARY_NAME"),
     "API_KEY": env("CLOUDINARY_API_KEY"),
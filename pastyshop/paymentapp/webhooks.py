@@ -5,6 +5,7 @@ from django.views.decorators.csrf import csrf_exempt
 
 from .tasks import payment_completed
 from ordersapp.models import Order
+from shop.tasks import products_bought
 
 
 @csrf_exempt
@@ -45,7 +46,9 @@ def stripe_webhook(request):
             # store Stripe payment ID
             order.stripe_id = session.payment_intent
             order.save()
-            # launch asynchronous task
+            # launch asynchronous tasks
             payment_completed.delay(order.id)
+            # recorded once per order, retries of this event are ignored
+            products_bought.delay(order.id)
 
     return HttpResponse(status=200)
@@ -22,6 +22,22 @@ class ProductAdmin(TranslatableAdmin):
     def get_prepopulated_fields(self, request, obj=None):
         return {"slug": ("name",)}
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            # comments posted while the product was edited changed the
+            # counter with F() expressions, don't overwrite it with the
+            # value the form was loaded with
+            obj.save(
+                update_fields=[
+                    field.name
+                    for field in obj._meta.concrete_fields
+                    if not field.primary_key
+                    and field.name != "active_comment_count"
+                ]
+            )
+        else:
+            super().save_model(request, obj, form, change)
+
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHES = {
+    "django.core.cache.backends.dummy.DummyCache",
+    "django.core.cache.backends.locmem.LocMemCache",
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The search results, the showcase pools, the bestsellers and the
+    similar products model are written by one process and read or
+    invalidated by the others, they need a cache shared by all of them.
+    """
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend not in LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            "The default cache is local to each process.",
+            hint=(
+                "Configure a shared cache, e.g. "
+                "django.core.cache.backends.redis.RedisCache, otherwise "
+                "the other processes keep serving stale search results "
+                "and showcase pools and never see the bestsellers."
+            ),
+            id="shop.W001",
+        )
+    ]
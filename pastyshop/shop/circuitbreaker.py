@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while, so a slow or unreachable
+    service costs a request one timeout instead of one per call.
+    The breaker opens after failure_threshold consecutive failures, calls
+    are then answered by the fallback until reset_timeout seconds passed
+    and a single trial call is let through again ("half-open"). A successful
+    trial closes the breaker, a failed one opens it for another timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name, failure_threshold, reset_timeout, errors):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.errors = errors
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.counters = {
+            "calls": 0,
+            "failures": 0,
+            "fallbacks": 0,
+            "opened": 0,
+        }
+
+    def allow(self):
+        """
+        The allow function tells whether the service may be called now.
+        When the reset timeout of an open breaker passed, only the first
+        caller is allowed to try.
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.trial = False
+            if self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info("Circuit breaker %s closed", self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.counters["failures"] += 1
+            self.failures += 1
+            if (
+                self.state == self.HALF_OPEN
+                or self.failures >= self.failure_threshold
+            ):
+                if self.state != self.OPEN:
+                    self.counters["opened"] += 1
+                    logger.warning("Circuit breaker %s opened", self.name)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, function, fallback, *args, **kwargs):
+        """
+        The call function calls the function while the breaker is closed,
+        or the fallback with the same arguments when it is open or the
+        function fails with one of the errors of the breaker.
+
+        :param self: Represent the instance of the class
+        :param function: The call to the service
+        :param fallback: The call that replaces it
+        :return: What the function or the fallback returns
+        """
+        with self.lock:
+            self.counters["calls"] += 1
+        if self.allow():
+            try:
+                result = function(*args, **kwargs)
+            except self.errors:
+                logger.warning(
+                    "Call through circuit breaker %s failed",
+                    self.name,
+                    exc_info=True,
+                )
+                self.record_failure()
+            except Exception:
+                # don't leave a half-open breaker waiting for its trial
+                self.record_failure()
+                raise
+            else:
+                self.record_success()
+                return result
+        with self.lock:
+            self.counters["fallbacks"] += 1
+        return fallback(*args, **kwargs)
+
+    def reset(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+            for name in self.counters:
+                self.counters[name] = 0
+
+    def info(self):
+        """
+        The info function returns the state and the counters of the breaker.
+        """
+        with self.lock:
+            return {"state": self.state, **self.counters}
@@ -0,0 +1,89 @@
+import numpy as np
+from scipy import sparse
+
+
+def iter_baskets(rows, batch_size):
+    """
+    The iter_baskets function groups (order_id, product_id, weight) rows
+    sorted by order into batches of about batch_size rows, an order is never
+    split between two batches.
+
+    :param rows: An iterable of (order_id, product_id, weight) sorted by
+        order_id, the weight is the same for every row of an order
+    :param batch_size: The number of rows per batch
+    :return: A generator of (order_ids, product_ids, weights) arrays
+    """
+    orders = []
+    products = []
+    weights = []
+    last_order = None
+    for order_id, product_id, weight in rows:
+        if order_id != last_order and len(orders) >= batch_size:
+            yield np.array(orders), np.array(products), np.array(weights)
+            orders = []
+            products = []
+            weights = []
+        last_order = order_id
+        orders.append(order_id)
+        products.append(product_id)
+        weights.append(weight)
+    if orders:
+        yield np.array(orders), np.array(products), np.array(weights)
+
+
+def count_copurchases(rows, size, batch_size=100_000):
+    """
+    The count_copurchases function builds the sparse product x product matrix
+    of the (weighted) number of orders each pair of products was bought
+    together in. Every batch of orders is an orders x products matrix B with
+    the diagonal matrix W of the order weights and adds B.T @ W @ B to the
+    total, so memory is bounded by the batch and the number of pairs.
+
+    :param rows: An iterable of (order_id, product_id, weight) sorted by
+        order_id
+    :param size: Greater than the largest product id
+    :param batch_size: The number of rows per batch
+    :return: A CSR matrix indexed by product ids
+    """
+    total = sparse.csr_matrix((size, size), dtype=np.float64)
+    for orders, products, weights in iter_baskets(rows, batch_size):
+        order_ids, first, order_index = np.unique(
+            orders, return_index=True, return_inverse=True
+        )
+        baskets = sparse.csr_matrix(
+            (np.ones(len(orders)), (order_index, products)),
+            shape=(len(order_ids), size),
+        )
+        # a product listed twice in an order counts once
+        baskets.data[:] = 1
+        order_weights = sparse.diags(weights[first], format="csr")
+        total = total + (baskets.T @ order_weights @ baskets).tocsr()
+    # a product is not bought together with itself
+    total = total - sparse.diags(
+        total.diagonal(), format="csr", dtype=total.dtype
+    )
+    total.eliminate_zeros()
+    return total
+
+
+def iter_top(matrix, k):
+    """
+    The iter_top function returns the k highest scores of every row.
+
+    :param matrix: A CSR matrix of scores
+    :param k: The number of scores to keep per row
+    :return: A generator of (row, [(column, score), ...]) best first,
+        for the rows that have scores
+    """
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+        columns = matrix.indices[start:end]
+        scores = matrix.data[start:end]
+        # ties go to the higher id, like with score_key
+        order = np.lexsort((-columns, -scores))[:k]
+        yield row, [
+            (int(column), float(score))
+            for column, score in zip(columns[order], scores[order])
+        ]
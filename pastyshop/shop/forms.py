@@ -19,21 +19,29 @@ class ProductFilterForm(forms.Form):
         widget=forms.Select(attrs={"class": "orderby"}),
     )
 
+    # every ordering ends with the primary key, so it is unique
+    # and can be used for keyset pagination
+    ORDERINGS = {
+        "price": ["price", "id"],
+        "price-desc": ["-price", "-id"],
+        "date": ["-updated", "-id"],
+    }
+
+    def get_ordering(self):
+        return self.ORDERINGS.get(self.cleaned_data.get("orderby"))
+
     def apply_sorting(self, queryset):
-        orderby = self.cleaned_data.get("orderby")
+        ordering = self.get_ordering()
 
-        if orderby == "price":
-            queryset = queryset.order_by("price")
-        elif orderby == "price-desc":
-            queryset = queryset.order_by("-price")
-        elif orderby == "date":
-            queryset = queryset.order_by("-updated")
+        if ordering:
+            queryset = queryset.order_by(*ordering)
 
         return queryset
 
 
 class SearchForm(forms.Form):
     query = forms.CharField()
+    top = forms.BooleanField(required=False, widget=forms.HiddenInput)
 
 
 class CommentForm(forms.ModelForm):
@@ -0,0 +1,96 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+# the benchmark products get ids far above the real ones
+FIRST_ID = 10**12
+
+
+class Command(BaseCommand):
+    help = (
+        "Time recording baskets and reading the top co-purchases with "
+        "each co-purchase storage. The scores are written under product "
+        "ids that are not used by the shop and are cleared afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--storage",
+            action="append",
+            help=(
+                "Dotted path of a storage to benchmark, can be repeated. "
+                "The in-memory and the configured storage by default."
+            ),
+        )
+        parser.add_argument(
+            "--products",
+            type=int,
+            default=1000,
+            help="Number of products in the baskets.",
+        )
+        parser.add_argument(
+            "--orders", type=int, default=5000, help="Number of baskets."
+        )
+        parser.add_argument(
+            "--basket-size",
+            type=int,
+            default=5,
+            help="Number of products per basket.",
+        )
+        parser.add_argument(
+            "--reads",
+            type=int,
+            default=5000,
+            help="Number of top co-purchase reads.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        storages = options["storage"] or list(
+            dict.fromkeys(
+                [
+                    "shop.purchases.memory.InMemoryPurchaseStorage",
+                    settings.RECOMMENDER_STORAGE,
+                ]
+            )
+        )
+        rng = random.Random(options["seed"])
+        products_ids = range(FIRST_ID, FIRST_ID + options["products"])
+        baskets = [
+            rng.sample(products_ids, options["basket_size"])
+            for _ in range(options["orders"])
+        ]
+        reads = [
+            rng.sample(products_ids, rng.randint(1, 4))
+            for _ in range(options["reads"])
+        ]
+
+        for path in storages:
+            storage = import_string(path)()
+            self.stdout.write(path)
+            try:
+                self.report(
+                    "record", len(baskets), self.time(storage.record, baskets)
+                )
+                self.report(
+                    "get_top",
+                    len(reads),
+                    self.time(lambda ids: storage.get_top(ids, 10), reads),
+                )
+            finally:
+                storage.clear(products_ids)
+
+    def time(self, function, calls):
+        start = time.perf_counter()
+        for arg in calls:
+            function(arg)
+        return time.perf_counter() - start
+
+    def report(self, name, calls, seconds):
+        self.stdout.write(
+            f"  {name}: {calls} calls in {seconds:.3f} s, "
+            f"{seconds / calls * 1e6:.1f} us per call"
+        )
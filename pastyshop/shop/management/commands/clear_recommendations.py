@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Category, Product
+from shop.recommender import Recommender
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the co-purchase scores of every product, of the products "
+        "of a category or of the given products."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "ids", nargs="*", type=int, help="Ids of the products to clear."
+        )
+        parser.add_argument(
+            "--category", help="Slug of the category to clear."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of products deleted per batch.",
+        )
+
+    def handle(self, *args, **options):
+        products_ids = options["ids"] or None
+        if options["category"]:
+            category = Category.objects.filter(
+                translations__slug=options["category"]
+            ).first()
+            if category is None:
+                raise CommandError(
+                    f"Category {options['category']!r} does not exist"
+                )
+            products = Product.objects.filter(category=category)
+            if products_ids:
+                products = products.filter(id__in=products_ids)
+            products_ids = products.values_list("id", flat=True).iterator()
+
+        cleared = Recommender().clear_purchases(
+            products_ids,
+            batch_size=options["batch_size"],
+            progress=lambda done: self.stdout.write(
+                f"Cleared {done} products..."
+            ),
+        )
+        self.stdout.write(f"Cleared the scores of {cleared} products.")
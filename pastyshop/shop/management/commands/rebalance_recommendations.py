@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.purchases import get_purchase_storage
+from shop.purchases.sharded import ShardedRedisPurchaseStorage
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the co-purchase scores to the Redis nodes they belong to "
+        "after RECOMMENDER_REDIS_NODES changed. Run it once every process "
+        "uses the new nodes, scores recorded through the old nodes while "
+        "it runs may be lost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            action="append",
+            default=[],
+            help="Url of a removed node to move all scores from.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of products moved per round trip.",
+        )
+
+    def handle(self, *args, **options):
+        storage = get_purchase_storage()
+        if not isinstance(storage, ShardedRedisPurchaseStorage):
+            raise CommandError(
+                "RECOMMENDER_STORAGE is not a sharded Redis storage"
+            )
+        moved = storage.rebalance(
+            options["source"],
+            batch_size=options["batch_size"],
+            progress=lambda moved: self.stdout.write(
+                f"Moved {moved} products..."
+            ),
+        )
+        self.stdout.write(f"Moved the scores of {moved} products.")
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from ordersapp.models import OrderItem
+from shop.copurchases import count_copurchases, iter_top
+from shop.models import Product
+from shop.purchases.base import get_weight
+from shop.recommender import Recommender
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the co-purchase scores of the recommender "
+        "from the items of the paid orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=settings.RECOMMENDER_TOP_K,
+            help="Number of scores kept per product.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100_000,
+            help="Number of order items counted at once.",
+        )
+        parser.add_argument(
+            "--half-life",
+            type=float,
+            default=settings.RECOMMENDER_HALF_LIFE,
+            help="Seconds after which an order counts half, none by default.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        The handle function streams the order items of the paid orders,
+        counts the orders every two products were bought together in and
+        replaces the sorted sets in Redis with the top scores. With a
+        half-life, older orders count less, as they would after decay.
+        """
+        now = timezone.now()
+        half_life = options["half_life"]
+        size = (Product.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+        items = (
+            OrderItem.objects.filter(order__paid=True, product_id__lt=size)
+            .order_by("order_id")
+            .values_list("order_id", "product_id", "order__created")
+            .iterator(chunk_size=10_000)
+        )
+        rows = (
+            (
+                order_id,
+                product_id,
+                get_weight((now - created).total_seconds(), half_life),
+            )
+            for order_id, product_id, created in items
+        )
+        matrix = count_copurchases(rows, size, options["batch_size"])
+        products_ids = Product.objects.order_by("id").values_list(
+            "id", flat=True
+        )
+        self.scored = 0
+        recommender = Recommender()
+        count = recommender.load_purchases(
+            self.iter_scores(
+                products_ids.iterator(), iter_top(matrix, options["top"])
+            )
+        )
+        recommender.set_decayed_at(now.timestamp())
+        self.stdout.write(
+            f"Loaded the scores of {self.scored} of {count} products, "
+            f"{matrix.nnz} product pairs were bought together."
+        )
+
+    def iter_scores(self, products_ids, tops):
+        """
+        The iter_scores function pairs every product with its top scores,
+        both are walked in the order of the ids, so the top scores of one
+        product at a time are in memory while the storage loads them in
+        batches. Products without scores are paired with None.
+
+        :param self: Represent the instance of the class
+        :param products_ids: The ids of the products in ascending order
+        :param tops: The (product_id, scores) of iter_top, in the same order
+        :return: A generator of (product_id, scores or None)
+        """
+        top = next(tops, None)
+        for id in products_ids:
+            # rows of products that were deleted are skipped
+            while top is not None and top[0] < id:
+                top = next(tops, None)
+            if top is not None and top[0] == id:
+                self.scored += 1
+                yield id, top[1]
+            else:
+                yield id, None
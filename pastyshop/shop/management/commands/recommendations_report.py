@@ -0,0 +1,49 @@
+import heapq
+
+from django.core.management.base import BaseCommand
+
+from shop.recommender import Recommender
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the number of co-purchase keys, their members "
+        "and the Redis memory they use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--largest",
+            type=int,
+            default=10,
+            help="Number of the largest keys to list.",
+        )
+
+    def handle(self, *args, **options):
+        keys = 0
+        members = 0
+        memory = 0
+        largest = []
+        sizes = Recommender().iter_purchase_sizes()
+        for key, key_members, key_memory in sizes:
+            keys += 1
+            members += key_members
+            memory += key_memory
+            item = (key_memory, key_members, key)
+            if len(largest) < options["largest"]:
+                heapq.heappush(largest, item)
+            elif largest:
+                heapq.heappushpop(largest, item)
+
+        self.stdout.write(f"Keys: {keys}")
+        self.stdout.write(f"Members: {members}")
+        self.stdout.write(
+            f"Members per key: {members / keys if keys else 0:.1f}"
+        )
+        self.stdout.write(f"Memory: {memory:,} bytes")
+        if largest:
+            self.stdout.write("Largest keys:")
+        for key_memory, key_members, key in sorted(largest, reverse=True):
+            self.stdout.write(
+                f"  {key}: {key_members} members, {key_memory:,} bytes"
+            )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from shop.models import recount_active_comments
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the active comments of every product or of the given "
+        "products, e.g. after Comment.active was changed with a queryset "
+        "update that bypassed the signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "ids", nargs="*", type=int, help="Ids of the products to recount."
+        )
+
+    def handle(self, *args, **options):
+        corrected = recount_active_comments(options["ids"] or None)
+        self.stdout.write(f"Corrected the count of {corrected} products.")
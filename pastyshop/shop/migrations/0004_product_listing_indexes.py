@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-17 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0003_comment"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["available", "price", "id"],
+                name="shop_produc_availab_db5f18_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["available", "-updated", "-id"],
+                name="shop_produc_availab_4c9e86_idx",
+            ),
+        ),
+    ]
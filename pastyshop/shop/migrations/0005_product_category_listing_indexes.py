@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0004_product_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "available", "price", "id"],
+                name="shop_produc_categor_a3b8aa_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "available", "-updated", "-id"],
+                name="shop_produc_categor_c20f44_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.1 on 2026-10-17 21:44
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Postgres ships no Ukrainian stemmer, so Ukrainian text is only
+# lowercased and split ("simple"), English text is stemmed.
+# Keep in sync with settings.SEARCH_CONFIGS.
+SEARCH_VECTOR_TRIGGER = """
+CREATE OR REPLACE FUNCTION shop_product_translation_search_vector()
+RETURNS trigger AS $$
+DECLARE
+    config regconfig := CASE NEW.language_code
+        WHEN 'en' THEN 'english'::regconfig
+        ELSE 'simple'::regconfig
+    END;
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector(config, coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector(config, coalesce(NEW.description, '')), 'B')
+        || setweight(
+            to_tsvector(config, coalesce(NEW.mini_description, '')), 'B'
+        );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER shop_product_translation_search_vector_update
+BEFORE INSERT OR UPDATE OF language_code, name, description, mini_description
+ON shop_product_translation
+FOR EACH ROW EXECUTE FUNCTION shop_product_translation_search_vector();
+
+UPDATE shop_product_translation SET name = name;
+"""
+
+DROP_SEARCH_VECTOR_TRIGGER = """
+DROP TRIGGER IF EXISTS shop_product_translation_search_vector_update
+ON shop_product_translation;
+DROP FUNCTION IF EXISTS shop_product_translation_search_vector();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0005_product_category_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="producttranslation",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="producttranslation",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="shop_product_search_gin"
+            ),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_TRIGGER, DROP_SEARCH_VECTOR_TRIGGER),
+    ]
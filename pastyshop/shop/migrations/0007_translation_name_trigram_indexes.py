@@ -0,0 +1,37 @@
+# Generated by Django 4.2.1 on 2026-10-17 21:47
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0006_producttranslation_search_vector"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="categorytranslation",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"),
+                    name="gin_trgm_ops",
+                ),
+                name="shop_category_name_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="producttranslation",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"),
+                    name="gin_trgm_ops",
+                ),
+                name="shop_product_name_trgm",
+            ),
+        ),
+    ]
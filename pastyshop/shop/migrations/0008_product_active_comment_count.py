@@ -0,0 +1,45 @@
+# Generated by Django 4.2.1 on 2026-10-17 21:54
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_active_comments(apps, schema_editor):
+    Comment = apps.get_model("shop", "Comment")
+    Product = apps.get_model("shop", "Product")
+    counts = (
+        Comment.objects.filter(product=OuterRef("pk"), active=True)
+        .order_by()
+        .values("product")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Product.objects.update(active_comment_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0007_translation_name_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="comment",
+            name="shop_commen_created_d90939_idx",
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="active_comment_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_active_comments, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["product", "active", "created", "id"],
+                name="shop_commen_product_fd5bf8_idx",
+            ),
+        ),
+    ]
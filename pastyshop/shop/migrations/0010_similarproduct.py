@@ -0,0 +1,52 @@
+# Generated by Django 4.2.1 on 2026-10-17 22:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0009_recommendation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarProduct",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_products",
+                        to="shop.product",
+                    ),
+                ),
+                (
+                    "similar",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_to",
+                        to="shop.product",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="similarproduct",
+            constraint=models.UniqueConstraint(
+                fields=("product", "similar"),
+                name="shop_similarproduct_unique",
+            ),
+        ),
+    ]
@@ -1,14 +1,67 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce, Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.urls import reverse
+from django.utils.translation import get_language
+from parler.appsettings import PARLER_LANGUAGES
+from parler.managers import TranslatableQuerySet
 from parler.models import TranslatableModel, TranslatedFields
 
 
+class TranslatedQuerySet(TranslatableQuerySet):
+    def prefetch_translations(self, *related, language=None):
+        """
+        The prefetch_translations function loads the translations of the
+        active language and its fallback languages in one query per model,
+        instead of one query per object when a translated field is read.
+
+        :param self: Represent the instance of the class
+        :param related: Lookups of translatable related objects to load
+            the translations of as well, e.g. "category"
+        :param language: The language code, the active language by default
+        :return: A queryset
+        """
+        languages = PARLER_LANGUAGES.get_active_choices(
+            language or get_language()
+        )
+        lookups = [("translations", self.model)]
+        for lookup in related:
+            model = self.model
+            for name in lookup.split("__"):
+                model = model._meta.get_field(name).related_model
+            lookups.append((f"{lookup}__translations", model))
+        return self.prefetch_related(
+            *(
+                Prefetch(
+                    lookup,
+                    queryset=model._parler_meta.root_model.objects.filter(
+                        language_code__in=languages
+                    ),
+                )
+                for lookup, model in lookups
+            )
+        )
+
+
 class Category(TranslatableModel):
     translations = TranslatedFields(
         name=models.CharField(max_length=200),
         slug=models.SlugField(max_length=200, unique=True),
+        meta={
+            "indexes": [
+                # prefix and fuzzy matches of the search suggestions
+                GinIndex(
+                    OpClass(Upper("name"), name="gin_trgm_ops"),
+                    name="shop_category_name_trgm",
+                ),
+            ],
+        },
     )
 
+    objects = TranslatedQuerySet.as_manager()
+
     class Meta:
         # ordering = ["name"]
         # indexes = [
@@ -30,6 +83,21 @@ class Product(TranslatableModel):
         slug=models.SlugField(max_length=200),
         description=models.TextField(blank=True),
         mini_description=models.TextField(blank=True, null=True),
+        # filled in by a database trigger, see shop.0006
+        search_vector=SearchVectorField(null=True, editable=False),
+        meta={
+            "indexes": [
+                GinIndex(
+                    fields=["search_vector"],
+                    name="shop_product_search_gin",
+                ),
+                # prefix and fuzzy matches of the search suggestions
+                GinIndex(
+                    OpClass(Upper("name"), name="gin_trgm_ops"),
+                    name="shop_product_name_trgm",
+                ),
+            ],
+        },
     )
     category = models.ForeignKey(
         Category, related_name="products", on_delete=models.SET_NULL, null=True
@@ -39,6 +107,15 @@ class Product(TranslatableModel):
     available = models.BooleanField(default=True)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
+    # maintained by the comment signals with F() updates, see shop.signals.
+    # Never assign it, a save of an instance loaded before a comment changed
+    # writes back the old count. The recount_comments command and the
+    # nightly task fix it after bulk updates of Comment.active
+    active_comment_count = models.PositiveIntegerField(
+        default=0, editable=False
+    )
+
+    objects = TranslatedQuerySet.as_manager()
 
     class Meta:
         # ordering = ["name"]
@@ -46,6 +123,13 @@ class Product(TranslatableModel):
             # models.Index(fields=["id", "slug"]),
             # models.Index(fields=["name"]),
             models.Index(fields=["-created"]),
+            # keyset pagination of the sorted product listing,
+            # "-price" is served by a backward scan of the price index
+            models.Index(fields=["available", "price", "id"]),
+            models.Index(fields=["available", "-updated", "-id"]),
+            # the same for the listing of a single category
+            models.Index(fields=["category", "available", "price", "id"]),
+            models.Index(fields=["category", "available", "-updated", "-id"]),
         ]
 
     def __str__(self):
@@ -73,8 +157,90 @@ class Comment(models.Model):
     class Meta:
         ordering = ["created"]
         indexes = [
-            models.Index(fields=["created"]),
+            # keyset pagination of the active comments of a product
+            models.Index(fields=["product", "active", "created", "id"]),
         ]
 
     def __str__(self):
         return f"Comment by {self.name} on {self.product}"
+
+
+def recount_active_comments(products_ids=None):
+    """
+    The recount_active_comments function recounts the active comments of
+    products whose active_comment_count drifted, e.g. after a stale save
+    or a queryset update of Comment.active that bypassed the signals.
+
+    :param products_ids: Only recount these products, every product by default
+    :return: The number of products that were corrected
+    """
+    counts = Coalesce(
+        Subquery(
+            Comment.objects.filter(product=OuterRef("pk"), active=True)
+            .order_by()
+            .values("product")
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+    products = Product.objects.all()
+    if products_ids is not None:
+        products = products.filter(id__in=products_ids)
+    return products.exclude(active_comment_count=counts).update(
+        active_comment_count=counts
+    )
+
+
+class Recommendation(models.Model):
+    """
+    A snapshot of the best co-purchases of a product, copied from the
+    recommender storage by the snapshot_recommendations task. It is read
+    while the storage is unavailable.
+    """
+
+    product = models.ForeignKey(
+        Product, related_name="recommendations", on_delete=models.CASCADE
+    )
+    recommended = models.ForeignKey(
+        Product, related_name="recommended_by", on_delete=models.CASCADE
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "recommended"],
+                name="shop_recommendation_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recommended_id} for {self.product_id}"
+
+
+class SimilarProduct(models.Model):
+    """
+    The products whose name, description and category are the most
+    similar to a product, see shop.similarity. They are recommended
+    when a product has too few co-purchases.
+    """
+
+    product = models.ForeignKey(
+        Product, related_name="similar_products", on_delete=models.CASCADE
+    )
+    similar = models.ForeignKey(
+        Product, related_name="similar_to", on_delete=models.CASCADE
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "similar"],
+                name="shop_similarproduct_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.similar_id} similar to {self.product_id}"
@@ -0,0 +1,272 @@
+import base64
+import binascii
+import datetime
+import json
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def encode_value(value):
+    """
+    Make the values of the ordering fields JSON serializable without
+    losing precision, so they can be compared exactly when decoded.
+    """
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot encode {value!r} in a cursor")
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, start, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.start = start
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f"<Page {self.start_index()}-{self.end_index()}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def start_index(self):
+        """
+        The 1-based index of the first object on this page.
+        """
+        return self.start + 1 if self.object_list else 0
+
+    def end_index(self):
+        """
+        The 1-based index of the last object on this page.
+        """
+        return self.start + len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return self.paginator.encode_cursor(
+            self.object_list[-1], self.end_index(), reverse=False
+        )
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return self.paginator.encode_cursor(
+            self.object_list[0], self.start, reverse=True
+        )
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by the values of its ordering fields instead of
+    OFFSET, so every page is a single index range scan no matter how deep it is.
+    The ordering must end with a unique field (usually "id" or "-id").
+    """
+
+    def __init__(self, queryset, ordering, per_page, count=None):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = int(per_page)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        """
+        The total number of objects. Pass an approximate or cached
+        count to the constructor to avoid a COUNT query.
+        """
+        if self._count is not None:
+            return self._count
+        return self.queryset.count()
+
+    def encode_cursor(self, obj, position, reverse):
+        """
+        The encode_cursor function stores the ordering values of the given object,
+        the position of the page and the direction in an opaque url-safe string.
+
+        :param self: Represent the instance of the class
+        :param obj: The first or last object of the current page
+        :param position: The 0-based index the next page starts or ends at
+        :param reverse: Whether the cursor points backwards
+        :return: A cursor string
+        """
+        values = [getattr(obj, field.lstrip("-")) for field in self.ordering]
+        data = json.dumps(
+            {"v": values, "p": position, "r": reverse},
+            default=encode_value,
+            separators=(",", ":"),
+        )
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """
+        The decode_cursor function is the reverse of encode_cursor.
+
+        :param self: Represent the instance of the class
+        :param cursor: A cursor string
+        :return: A tuple of ordering values, position and direction
+        """
+        try:
+            padding = "=" * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            values, position, reverse = data["v"], int(data["p"]), data["r"]
+        except (
+            binascii.Error,
+            UnicodeDecodeError,
+            ValueError,
+            TypeError,
+            KeyError,
+        ):
+            raise InvalidCursor("That cursor is not valid")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor("That cursor is not valid")
+        return values, max(position, 0), bool(reverse)
+
+    def get_boundary_filter(self, values, reverse):
+        """
+        The get_boundary_filter function builds the condition that selects the rows
+        after (or before, when reverse is True) the row with the given values,
+        e.g. (price > x) OR (price = x AND id > y) for the ordering ["price", "id"].
+
+        :param self: Represent the instance of the class
+        :param values: The ordering values of the boundary row
+        :param reverse: Whether the rows before the boundary are selected
+        :return: A Q object
+        """
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+            step = Q(**{f"{name}__{lookup}": values[i]})
+            for prior, value in zip(self.ordering[:i], values[:i]):
+                step &= Q(**{prior.lstrip("-"): value})
+            condition |= step
+        return condition
+
+    def page(self, cursor=None):
+        """
+        The page function returns the page the cursor points to,
+        or the first page when no cursor is given.
+        One extra row is fetched to find out if there are more rows
+        in the direction of travel.
+
+        :param self: Represent the instance of the class
+        :param cursor: A cursor string from next_cursor or previous_cursor
+        :return: A KeysetPage object
+        """
+        if not cursor:
+            rows = list(
+                self.queryset.order_by(*self.ordering)[: self.per_page + 1]
+            )
+            return KeysetPage(
+                rows[: self.per_page],
+                self,
+                0,
+                has_next=len(rows) > self.per_page,
+                has_previous=False,
+            )
+
+        values, position, reverse = self.decode_cursor(cursor)
+        queryset = self.queryset.filter(
+            self.get_boundary_filter(values, reverse)
+        )
+        if not reverse:
+            rows = list(queryset.order_by(*self.ordering)[: self.per_page + 1])
+            return KeysetPage(
+                rows[: self.per_page],
+                self,
+                position,
+                has_next=len(rows) > self.per_page,
+                has_previous=True,
+            )
+
+        reversed_ordering = [
+            field[1:] if field.startswith("-") else f"-{field}"
+            for field in self.ordering
+        ]
+        rows = list(queryset.order_by(*reversed_ordering)[: self.per_page + 1])
+        object_list = rows[: self.per_page][::-1]
+        return KeysetPage(
+            object_list,
+            self,
+            max(position - len(object_list), 0),
+            has_next=True,
+            has_previous=len(rows) > self.per_page,
+        )
+
+
+class RankedListPaginator(KeysetPaginator):
+    """
+    Keyset pagination over a list that is already sorted by the ordering,
+    such as the ranked results of a search backend. The page boundaries
+    are found by bisection, so the positions and the count are exact.
+    The ordering fields must be numbers.
+    """
+
+    def __init__(self, object_list, ordering, per_page):
+        super().__init__(
+            object_list, ordering, per_page, count=len(object_list)
+        )
+
+    def get_sort_key(self, values):
+        return tuple(
+            -value if field.startswith("-") else value
+            for field, value in zip(self.ordering, values)
+        )
+
+    def get_object_key(self, obj):
+        return self.get_sort_key(
+            [getattr(obj, field.lstrip("-")) for field in self.ordering]
+        )
+
+    def page(self, cursor=None):
+        object_list = self.queryset
+        start = 0
+        if cursor:
+            values, position, reverse = self.decode_cursor(cursor)
+            try:
+                key = self.get_sort_key(values)
+            except TypeError:
+                raise InvalidCursor("That cursor is not valid")
+            if reverse:
+                end = bisect_left(object_list, key, key=self.get_object_key)
+                start = max(end - self.per_page, 0)
+            else:
+                start = bisect_right(object_list, key, key=self.get_object_key)
+        end = start + self.per_page
+        return KeysetPage(
+            object_list[start:end],
+            self,
+            start,
+            has_next=end < len(object_list),
+            has_previous=start > 0,
+        )
@@ -0,0 +1,15 @@
+from functools import cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import PurchaseStorage
+
+
+@cache
+def get_purchase_storage():
+    """
+    The get_purchase_storage function returns the co-purchase score storage
+    of this process, picked by the RECOMMENDER_STORAGE setting.
+    """
+    return import_string(settings.RECOMMENDER_STORAGE)()
@@ -0,0 +1,179 @@
+from django.conf import settings
+
+
+def get_record_top_k():
+    """
+    The get_record_top_k function returns how many scores a product keeps
+    when an order is recorded, twice RECOMMENDER_TOP_K. A new pair starts
+    with a score of 1 and needs room to rise above the old ones, the
+    trim_purchases task cuts the scores down to RECOMMENDER_TOP_K.
+    """
+    return 2 * settings.RECOMMENDER_TOP_K
+
+
+def get_weight(age, half_life):
+    """
+    The get_weight function returns the weight of an order in the
+    co-purchase scores, it halves every half_life seconds.
+
+    :param age: The age of the order in seconds
+    :param half_life: The half-life in seconds, None disables the decay
+    :return: A float between 0 and 1
+    """
+    if not half_life:
+        return 1.0
+    return 0.5 ** (max(age, 0) / half_life)
+
+
+def score_key(item):
+    """
+    The sort key of a (product_id, score) pair, best score first and ties
+    to the higher id. ZRANGE ... REV breaks ties by the bytes of the ids
+    instead, that is the same only for ids of the same length.
+    """
+    product_id, score = item
+    return score, product_id
+
+
+class PurchaseStorage:
+    """
+    The interface of the co-purchase score storages. For every product
+    a storage keeps the scores of the products bought together with it and
+    a version that changes whenever those scores change.
+    Products are identified by their ids.
+    """
+
+    def record(self, products_ids, order_id=None):
+        """
+        The record function adds 1 to the score of every pair of products
+        bought together and keeps the get_record_top_k() best scores of each.
+
+        :param self: Represent the instance of the class
+        :param products_ids: The ids of the products of a basket
+        :param order_id: The id of the order, an order is recorded only
+            once for RECOMMENDER_ORDER_TIMEOUT seconds
+        :return: False if the order was already recorded, True otherwise
+        """
+        raise NotImplementedError
+
+    def get_scores(self, product_id):
+        """
+        The get_scores function returns the scores of a product.
+
+        :param self: Represent the instance of the class
+        :param product_id: The id of the product
+        :return: A list of (product_id, score), best first
+        """
+        raise NotImplementedError
+
+    def get_many_scores(self, products_ids, count):
+        """
+        The get_many_scores function returns the best scores of several
+        products at once.
+
+        :param self: Represent the instance of the class
+        :param products_ids: A list of product ids
+        :param count: The maximum number of scores per product
+        :return: A dictionary of product id to a list of (product_id, score),
+            best first, products without scores are left out
+        """
+        many_scores = {}
+        for product_id in products_ids:
+            scores = self.get_scores(product_id)[:count]
+            if scores:
+                many_scores[product_id] = scores
+        return many_scores
+
+    def get_versions(self, products_ids):
+        """
+        The get_versions function returns the versions of the scores of the
+        given products, they are equal as long as the scores didn't change.
+
+        :param self: Represent the instance of the class
+        :param products_ids: A list of product ids
+        :return: A tuple of versions
+        """
+        raise NotImplementedError
+
+    def get_top(self, products_ids, count):
+        """
+        The get_top function sums the scores of the given products and
+        returns the best other products.
+
+        :param self: Represent the instance of the class
+        :param products_ids: A list of product ids
+        :param count: The maximum number of ids to return
+        :return: A list of product ids, best first
+        """
+        raise NotImplementedError
+
+    def load(self, scores, batch_size=500):
+        """
+        The load function replaces the scores of products.
+
+        :param self: Represent the instance of the class
+        :param scores: An iterable of (product_id, [(with_id, score), ...]),
+            a product with no scores is cleared
+        :param batch_size: The number of products written at once
+        :return: The number of products loaded
+        """
+        raise NotImplementedError
+
+    def decay(self, half_life, min_score, batch_size=500):
+        """
+        The decay function scales every score down by the time passed since
+        the previous decay, so a score halves every half_life seconds, and
+        drops the scores below min_score. The first call only records the
+        time.
+
+        :param self: Represent the instance of the class
+        :param half_life: The half-life of a score in seconds
+        :param min_score: The smallest score that is kept
+        :param batch_size: The number of products decayed at once
+        :return: The number of products that were decayed
+        """
+        raise NotImplementedError
+
+    def set_decayed_at(self, timestamp):
+        """
+        The set_decayed_at function records that the scores are up to date
+        at the given unix timestamp.
+        """
+        raise NotImplementedError
+
+    def trim(self, top_k, batch_size=500):
+        """
+        The trim function drops all but the top_k best scores of every
+        product.
+
+        :param self: Represent the instance of the class
+        :param top_k: The number of scores kept per product
+        :param batch_size: The number of products trimmed at once
+        :return: The number of scores that were dropped
+        """
+        raise NotImplementedError
+
+    def iter_sizes(self, batch_size=500):
+        """
+        The iter_sizes function returns the number of scores and the memory
+        used by every product that has scores.
+
+        :param self: Represent the instance of the class
+        :param batch_size: The number of products read at once
+        :return: A generator of (name, members, bytes)
+        """
+        raise NotImplementedError
+
+    def clear(self, products_ids=None, batch_size=500, progress=None):
+        """
+        The clear function deletes the scores of the given products,
+        or of every product.
+
+        :param self: Represent the instance of the class
+        :param products_ids: The ids of the products to clear, all by default
+        :param batch_size: The number of products deleted at once
+        :param progress: Called with the number of products done so far
+            after every batch
+        :return: The number of products that had scores
+        """
+        raise NotImplementedError
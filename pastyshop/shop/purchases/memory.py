@@ -0,0 +1,155 @@
+import heapq
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.conf import settings
+
+from .base import PurchaseStorage, get_record_top_k, get_weight, score_key
+
+
+class InMemoryPurchaseStorage(PurchaseStorage):
+    """
+    Co-purchase scores in the memory of the process, for single-node
+    deployments and tests. Every product has a dict of scores, the top
+    scores are picked with a heap instead of sorting the whole dict.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.scores = defaultdict(Counter)
+        self.versions = Counter()
+        self.orders = {}
+        self.decayed_at = None
+
+    def _trim(self, product_id, top_k):
+        scores = self.scores[product_id]
+        if len(scores) > top_k:
+            self.scores[product_id] = Counter(
+                dict(heapq.nlargest(top_k, scores.items(), key=score_key))
+            )
+            return len(scores) - top_k
+        return 0
+
+    def record(self, products_ids, order_id=None):
+        products_ids = list(dict.fromkeys(products_ids))
+        with self.lock:
+            if order_id is not None:
+                now = time.monotonic()
+                if self.orders.get(order_id, 0) > now:
+                    return False
+                self.orders[order_id] = (
+                    now + settings.RECOMMENDER_ORDER_TIMEOUT
+                )
+            for product_id in products_ids:
+                if len(products_ids) > 1:
+                    scores = self.scores[product_id]
+                    for with_id in products_ids:
+                        if product_id != with_id:
+                            scores[with_id] += 1
+                    self._trim(product_id, get_record_top_k())
+                self.versions[product_id] += 1
+        return True
+
+    def get_scores(self, product_id):
+        with self.lock:
+            scores = self.scores.get(product_id, {})
+            return sorted(scores.items(), key=score_key, reverse=True)
+
+    def get_versions(self, products_ids):
+        with self.lock:
+            return tuple(self.versions.get(id) for id in products_ids)
+
+    def get_top(self, products_ids, count):
+        with self.lock:
+            if len(products_ids) == 1:
+                total = self.scores.get(products_ids[0], {})
+            else:
+                total = Counter()
+                for product_id in products_ids:
+                    total.update(self.scores.get(product_id, {}))
+                for product_id in products_ids:
+                    total.pop(product_id, None)
+            top = heapq.nlargest(count, total.items(), key=score_key)
+        return [product_id for product_id, _ in top]
+
+    def load(self, scores, batch_size=500):
+        count = 0
+        with self.lock:
+            for product_id, product_scores in scores:
+                self.scores.pop(product_id, None)
+                if product_scores:
+                    self.scores[product_id] = Counter(dict(product_scores))
+                self.versions[product_id] += 1
+                count += 1
+        return count
+
+    def decay(self, half_life, min_score, batch_size=500):
+        now = time.time()
+        with self.lock:
+            decayed_at, self.decayed_at = self.decayed_at, now
+            if decayed_at is None:
+                return 0
+            factor = get_weight(now - decayed_at, half_life)
+            count = len(self.scores)
+            for product_id, scores in list(self.scores.items()):
+                decayed = Counter(
+                    {
+                        with_id: score * factor
+                        for with_id, score in scores.items()
+                        if score * factor >= min_score
+                    }
+                )
+                if decayed:
+                    self.scores[product_id] = decayed
+                else:
+                    del self.scores[product_id]
+                self.versions[product_id] += 1
+            return count
+
+    def set_decayed_at(self, timestamp):
+        with self.lock:
+            self.decayed_at = timestamp
+
+    def trim(self, top_k, batch_size=500):
+        with self.lock:
+            removed = 0
+            for product_id in self.scores:
+                if trimmed := self._trim(product_id, top_k):
+                    removed += trimmed
+                    self.versions[product_id] += 1
+            return removed
+
+    def iter_sizes(self, batch_size=500):
+        with self.lock:
+            sizes = [
+                (
+                    f"product:{product_id}:purchased_with",
+                    len(scores),
+                    sys.getsizeof(scores),
+                )
+                for product_id, scores in self.scores.items()
+            ]
+        return iter(sizes)
+
+    def clear(self, products_ids=None, batch_size=500, progress=None):
+        with self.lock:
+            if products_ids is None:
+                products_ids = list(self.scores)
+        products_ids = iter(products_ids)
+        cleared = 0
+        done = 0
+        while batch := list(islice(products_ids, batch_size)):
+            with self.lock:
+                for product_id in batch:
+                    if self.scores.pop(int(product_id), None) is not None:
+                        cleared += 1
+                        # a version that started over would match the
+                        # recommendations cached before the clear
+                        self.versions[int(product_id)] += 1
+            done += len(batch)
+            if progress:
+                progress(done)
+        return cleared
@@ -0,0 +1,281 @@
+import time
+
+import redis
+from django.conf import settings
+
+from .base import PurchaseStorage, get_record_top_k, get_weight
+
+# KEYS[1] marks the order as recorded, then come the purchased_with keys and
+# the version keys of the n products in ARGV[4..3 + n], their scores with
+# the products of the basket that follow are incremented, ARGV[1] is how
+# long the order is remembered, ARGV[2] how many scores a product keeps
+# and ARGV[3] is n
+RECORD_ORDER_SCRIPT = """
+if not redis.call("SET", KEYS[1], 1, "NX", "EX", ARGV[1]) then
+    return 0
+end
+local n = tonumber(ARGV[3])
+for i = 1, n do
+    for j = 4 + n, #ARGV do
+        if ARGV[3 + i] ~= ARGV[j] then
+            redis.call("ZINCRBY", KEYS[1 + i], 1, ARGV[j])
+        end
+    end
+    redis.call("ZREMRANGEBYRANK", KEYS[1 + i], 0, -ARGV[2] - 1)
+    redis.call("INCR", KEYS[1 + n + i])
+end
+return 1
+"""
+
+# fail fast, the recommender falls back to its snapshot
+CLIENT_OPTIONS = {
+    "socket_timeout": settings.RECOMMENDER_REDIS_TIMEOUT,
+    "socket_connect_timeout": settings.RECOMMENDER_REDIS_TIMEOUT,
+}
+
+
+class RedisPurchaseStorage(PurchaseStorage):
+    """
+    Co-purchase scores in a sorted set per product, shared by every process.
+    Round trips are batched with pipelines and keys are walked with SCAN.
+    The connection is opened on first use.
+    """
+
+    # the time the co-purchase scores were last decayed
+    decayed_at_key = "recommender:decayed_at"
+
+    def __init__(self, client=None):
+        self.r = client or redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            **CLIENT_OPTIONS,
+        )
+        self.record_order_script = self.r.register_script(RECORD_ORDER_SCRIPT)
+
+    def get_product_key(self, id):
+        return f"product:{id}:purchased_with"
+
+    def get_version_key(self, id):
+        return f"product:{id}:version"
+
+    def get_product_id(self, key):
+        # product:<id>:purchased_with
+        return key.split(b":")[1].decode()
+
+    def get_order_key(self, order_id):
+        return f"order:{order_id}:recorded"
+
+    def iter_keys(self):
+        """
+        The iter_keys function iterates over the purchased_with keys
+        with SCAN, so Redis is never blocked like with KEYS.
+        """
+        return self.r.scan_iter(match=self.get_product_key("*"), count=1000)
+
+    def record(self, products_ids, order_id=None):
+        """
+        The record function sends all the scores in a single round trip.
+        With an order id, a Lua script skips orders that were already
+        recorded, e.g. on a webhook retry.
+        """
+        products_ids = list(dict.fromkeys(products_ids))
+        return self.increment(products_ids, products_ids, order_id)
+
+    def increment(self, products_ids, with_ids, order_id=None):
+        """
+        The increment function adds 1 to the scores of the given products
+        with every other product of with_ids, in a single round trip.
+        With an order id, the order is marked in this database by the same
+        script that increments the scores, so a retry skips it.
+
+        :param self: Represent the instance of the class
+        :param products_ids: The ids of the products whose scores change
+        :param with_ids: The ids of all the products of the basket
+        :param order_id: The id of the order the products were bought in
+        :return: False if the order was already recorded, True otherwise
+        """
+        if order_id is not None:
+            keys = [self.get_product_key(id) for id in products_ids]
+            version_keys = [self.get_version_key(id) for id in products_ids]
+            return bool(
+                self.record_order_script(
+                    keys=[self.get_order_key(order_id), *keys, *version_keys],
+                    args=[
+                        settings.RECOMMENDER_ORDER_TIMEOUT,
+                        get_record_top_k(),
+                        len(products_ids),
+                        *products_ids,
+                        *with_ids,
+                    ],
+                )
+            )
+        top_k = get_record_top_k()
+        with self.r.pipeline(transaction=False) as pipe:
+            for product_id in products_ids:
+                key = self.get_product_key(product_id)
+                for with_id in with_ids:
+                    # increment score for product purchased together
+                    if product_id != with_id:
+                        pipe.zincrby(key, 1, with_id)
+                # keep the sorted set bounded
+                pipe.zremrangebyrank(key, 0, -top_k - 1)
+                pipe.incr(self.get_version_key(product_id))
+            pipe.execute()
+        return True
+
+    def get_scores(self, product_id):
+        scores = self.r.zrange(
+            self.get_product_key(product_id), 0, -1, desc=True, withscores=True
+        )
+        return [(int(id), score) for id, score in scores]
+
+    def get_many_scores(self, products_ids, count):
+        with self.r.pipeline(transaction=False) as pipe:
+            for id in products_ids:
+                pipe.zrange(
+                    self.get_product_key(id),
+                    0,
+                    count - 1,
+                    desc=True,
+                    withscores=True,
+                )
+            results = pipe.execute()
+        return {
+            product_id: [(int(id), score) for id, score in scores]
+            for product_id, scores in zip(products_ids, results)
+            if scores
+        }
+
+    def get_versions(self, products_ids):
+        return tuple(
+            self.r.mget([self.get_version_key(id) for id in products_ids])
+        )
+
+    def get_top(self, products_ids, count):
+        if len(products_ids) == 1:
+            # only 1 product, read just the top of its sorted set
+            top = self.r.zrange(
+                self.get_product_key(products_ids[0]), 0, count - 1, desc=True
+            )
+        else:
+            # multiple products, combine scores of all products in a
+            # temporary key named after the sorted ids, the transaction
+            # keeps concurrent requests for the same ids apart
+            products_ids = sorted(products_ids)
+            tmp_key = "tmp:suggest:" + ",".join(map(str, products_ids))
+            keys = [self.get_product_key(id) for id in products_ids]
+            with self.r.pipeline() as pipe:
+                pipe.zunionstore(tmp_key, keys)
+                # remove ids for the products the recommendation is for
+                pipe.zrem(tmp_key, *products_ids)
+                # get the top product ids by their score
+                pipe.zrange(tmp_key, 0, count - 1, desc=True)
+                pipe.delete(tmp_key)
+                top = pipe.execute()[2]
+        return [int(id) for id in top]
+
+    def load(self, scores, batch_size=500):
+        """
+        The load function pipelines the writes in transactions of batch_size
+        products, so a product never appears without its scores.
+        """
+        count = 0
+        pipe = self.r.pipeline()
+        for product_id, product_scores in scores:
+            key = self.get_product_key(product_id)
+            pipe.delete(key)
+            if product_scores:
+                pipe.zadd(key, dict(product_scores))
+            pipe.incr(self.get_version_key(product_id))
+            count += 1
+            if count % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+        return count
+
+    def decay(self, half_life, min_score, batch_size=500):
+        now = time.time()
+        decayed_at = self.r.getset(self.decayed_at_key, now)
+        if decayed_at is None:
+            return 0
+        factor = get_weight(now - float(decayed_at), half_life)
+        count = 0
+        with self.r.pipeline(transaction=False) as pipe:
+            for key in self.iter_keys():
+                pipe.zunionstore(key, {key: factor})
+                pipe.zremrangebyscore(key, "-inf", f"({min_score}")
+                # the cached recommendations of the product are stale
+                pipe.incr(self.get_version_key(self.get_product_id(key)))
+                count += 1
+                if count % batch_size == 0:
+                    pipe.execute()
+            pipe.execute()
+        return count
+
+    def set_decayed_at(self, timestamp):
+        self.r.set(self.decayed_at_key, timestamp)
+
+    def trim(self, top_k, batch_size=500):
+        removed = 0
+        with self.r.pipeline(transaction=False) as pipe:
+            for i, key in enumerate(self.iter_keys(), 1):
+                pipe.zremrangebyrank(key, 0, -top_k - 1)
+                pipe.incr(self.get_version_key(self.get_product_id(key)))
+                if i % batch_size == 0:
+                    removed += sum(pipe.execute()[::2])
+            removed += sum(pipe.execute()[::2])
+        return removed
+
+    def iter_sizes(self, batch_size=500):
+        keys = self.iter_keys()
+        while True:
+            batch = [key for _, key in zip(range(batch_size), keys)]
+            if not batch:
+                return
+            with self.r.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.zcard(key)
+                    pipe.memory_usage(key)
+                sizes = pipe.execute()
+            for i, key in enumerate(batch):
+                yield key.decode(), sizes[2 * i], sizes[2 * i + 1] or 0
+
+    def clear(self, products_ids=None, batch_size=500, progress=None):
+        """
+        The clear function finds the keys with SCAN instead of asking
+        Postgres for every product id and deletes them with UNLINK in
+        pipelined batches, so Redis frees the memory in the background.
+        """
+        if products_ids is None:
+            products_ids = map(self.get_product_id, self.iter_keys())
+        cleared = 0
+        done = 0
+        batch = []
+        for id in products_ids:
+            batch.append(id)
+            if len(batch) == batch_size:
+                cleared += self._unlink(batch)
+                done += len(batch)
+                batch = []
+                if progress:
+                    progress(done)
+        if batch:
+            cleared += self._unlink(batch)
+            done += len(batch)
+            if progress:
+                progress(done)
+        return cleared
+
+    def _unlink(self, products_ids):
+        with self.r.pipeline(transaction=False) as pipe:
+            for id in products_ids:
+                pipe.unlink(self.get_product_key(id))
+            unlinked = pipe.execute()
+            # the versions are kept and bumped, a version that started
+            # over would match recommendations cached before the clear
+            for id, removed in zip(products_ids, unlinked):
+                if removed:
+                    pipe.incr(self.get_version_key(id))
+            pipe.execute()
+        return sum(unlinked)
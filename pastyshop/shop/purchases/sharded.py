@@ -0,0 +1,291 @@
+import hashlib
+import heapq
+from bisect import bisect
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import redis
+from django.conf import settings
+
+from .base import PurchaseStorage, get_record_top_k, score_key
+from .redis import CLIENT_OPTIONS, RedisPurchaseStorage
+
+
+def get_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of keys to nodes. Every node is placed on the ring
+    at many points, so the keys are spread evenly and adding a node only
+    moves the keys it takes over, about 1/n of them, from the other nodes.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        points = sorted(
+            (get_hash(f"{node}#{i}"), node)
+            for node in nodes
+            for i in range(replicas)
+        )
+        self.hashes = [hash for hash, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def get_node(self, key):
+        """
+        The get_node function returns the node of the first point of the
+        ring at or after the hash of the key.
+        """
+        return self.nodes[bisect(self.hashes, get_hash(key)) % len(self.nodes)]
+
+
+class ShardedRedisPurchaseStorage(PurchaseStorage):
+    """
+    Co-purchase scores spread over the Redis nodes of the
+    RECOMMENDER_REDIS_NODES setting. A product is placed by consistent
+    hashing of its id, its scores and its version live on the same node.
+    Reads that touch several nodes are sent to them in parallel and merged
+    here. After a node was added, rebalance moves the scores to the nodes
+    they now belong to.
+    """
+
+    def __init__(self, nodes=None):
+        nodes = list(nodes or settings.RECOMMENDER_REDIS_NODES)
+        if not nodes:
+            raise ValueError("RECOMMENDER_REDIS_NODES is empty")
+        self.ring = HashRing(nodes)
+        self.shards = {node: self.connect(node) for node in nodes}
+        self.executor = ThreadPoolExecutor(max_workers=len(nodes))
+
+    def connect(self, node):
+        return RedisPurchaseStorage(
+            redis.Redis.from_url(node, **CLIENT_OPTIONS)
+        )
+
+    def get_shard(self, product_id):
+        return self.shards[self.ring.get_node(str(product_id))]
+
+    def group(self, products_ids):
+        """
+        The group function splits product ids by the shard they live on.
+
+        :param self: Represent the instance of the class
+        :param products_ids: An iterable of product ids
+        :return: A dictionary of shard to a list of product ids
+        """
+        groups = defaultdict(list)
+        for id in products_ids:
+            groups[self.get_shard(id)].append(id)
+        return groups
+
+    def map(self, function, groups):
+        """
+        The map function calls function(shard, products_ids) for every
+        group, in parallel when there are several.
+
+        :return: A list of the results
+        """
+        if len(groups) == 1:
+            return [function(*next(iter(groups.items())))]
+        futures = [
+            self.executor.submit(function, shard, products_ids)
+            for shard, products_ids in groups.items()
+        ]
+        return [future.result() for future in futures]
+
+    def record(self, products_ids, order_id=None):
+        """
+        The record function increments the scores on every shard of the
+        basket. With an order id, every shard marks the order together with
+        its increments, atomically. When a shard fails, the error is raised
+        and a retry only records the order on the shards that missed it.
+        """
+        products_ids = list(dict.fromkeys(products_ids))
+        recorded = self.map(
+            lambda shard, ids: shard.increment(ids, products_ids, order_id),
+            self.group(products_ids),
+        )
+        # False only when every shard had recorded the order already
+        return not recorded or any(recorded)
+
+    def get_scores(self, product_id):
+        return self.get_shard(product_id).get_scores(product_id)
+
+    def get_many_scores(self, products_ids, count):
+        many_scores = {}
+        for scores in self.map(
+            lambda shard, ids: shard.get_many_scores(ids, count),
+            self.group(products_ids),
+        ):
+            many_scores.update(scores)
+        return many_scores
+
+    def get_versions(self, products_ids):
+        versions = {}
+        groups = self.group(products_ids)
+        for shard_versions, ids in zip(
+            self.map(lambda shard, ids: shard.get_versions(ids), groups),
+            groups.values(),
+        ):
+            versions.update(zip(ids, shard_versions))
+        return tuple(versions[id] for id in products_ids)
+
+    def get_top(self, products_ids, count):
+        # the sorted sets hold at most get_record_top_k() scores, reading
+        # them whole makes the merged top exact, and ties are broken by
+        # score_key for a single product too, not by Redis
+        total = Counter()
+        many_scores = self.get_many_scores(products_ids, get_record_top_k())
+        for scores in many_scores.values():
+            for id, score in scores:
+                total[id] += score
+        for id in products_ids:
+            total.pop(id, None)
+        top = heapq.nlargest(count, total.items(), key=score_key)
+        return [id for id, _ in top]
+
+    def load(self, scores, batch_size=500):
+        scores = iter(scores)
+        count = 0
+        while batch := list(islice(scores, batch_size)):
+            groups = defaultdict(list)
+            for product_id, product_scores in batch:
+                groups[self.get_shard(product_id)].append(
+                    (product_id, product_scores)
+                )
+            count += sum(
+                self.map(lambda shard, scores: shard.load(scores), groups)
+            )
+        return count
+
+    def decay(self, half_life, min_score, batch_size=500):
+        return sum(
+            shard.decay(half_life, min_score, batch_size)
+            for shard in self.shards.values()
+        )
+
+    def set_decayed_at(self, timestamp):
+        for shard in self.shards.values():
+            shard.set_decayed_at(timestamp)
+
+    def trim(self, top_k, batch_size=500):
+        return sum(
+            shard.trim(top_k, batch_size) for shard in self.shards.values()
+        )
+
+    def iter_sizes(self, batch_size=500):
+        for shard in self.shards.values():
+            yield from shard.iter_sizes(batch_size)
+
+    def clear(self, products_ids=None, batch_size=500, progress=None):
+        if products_ids is None:
+            cleared = 0
+            for shard in self.shards.values():
+                # a shard walks only the products that have scores,
+                # so the products cleared so far are the products done
+                shard_progress = progress and (
+                    lambda done, offset=cleared: progress(offset + done)
+                )
+                cleared += shard.clear(None, batch_size, shard_progress)
+            return cleared
+        products_ids = iter(products_ids)
+        cleared = 0
+        done = 0
+        while batch := list(islice(products_ids, batch_size)):
+            cleared += sum(
+                self.map(
+                    lambda shard, ids: shard.clear(ids, batch_size),
+                    self.group(batch),
+                )
+            )
+            done += len(batch)
+            if progress:
+                progress(done)
+        return cleared
+
+    def rebalance(self, sources=(), batch_size=500, progress=None):
+        """
+        The rebalance function moves the scores of the products that are
+        stored on another node than the one the ring places them on, e.g.
+        after a node was added. The moved scores are added to the scores
+        recorded on the new node in the meantime.
+
+        :param self: Represent the instance of the class
+        :param sources: Urls of nodes that are no longer in the ring and
+            must be emptied
+        :param batch_size: The number of products per round trip
+        :param progress: Called with the number of products moved so far
+            after every batch
+        :return: The number of products moved
+        """
+        shards = list(self.shards.values())
+        shards += [self.connect(node) for node in sources]
+        moved = 0
+        for source in shards:
+            keys = source.iter_keys()
+            while batch := list(islice(keys, batch_size)):
+                groups = self.group(map(source.get_product_id, batch))
+                for target, products_ids in groups.items():
+                    if target is not source:
+                        moved += self.move(source, target, products_ids)
+                if progress:
+                    progress(moved)
+        return moved
+
+    def move(self, source, target, products_ids):
+        """
+        The move function takes the scores of the products off the source
+        shard and adds them to the target. The scores are read and deleted
+        in one transaction, so scores that processes still using the old
+        ring record on the source meanwhile are not lost or counted twice,
+        they stay on the source until the next rebalance. When the target
+        fails, the scores are put back on the source.
+
+        :param self: Represent the instance of the class
+        :param source: The shard the products are stored on
+        :param target: The shard the ring places them on
+        :param products_ids: The ids of the products to move
+        :return: The number of products moved
+        """
+        with source.r.pipeline() as pipe:
+            for product_id in products_ids:
+                key = source.get_product_key(product_id)
+                pipe.zrange(key, 0, -1, withscores=True)
+                pipe.unlink(key)
+                pipe.incr(source.get_version_key(product_id))
+            results = pipe.execute()[::3]
+        # a key can be gone since it was found by SCAN
+        many_scores = {
+            product_id: scores
+            for product_id, scores in zip(products_ids, results)
+            if scores
+        }
+        try:
+            self.merge(target, many_scores)
+        except redis.RedisError:
+            self.merge(source, many_scores)
+            raise
+        return len(many_scores)
+
+    def merge(self, shard, many_scores):
+        """
+        The merge function adds scores to the scores of the products on
+        a shard and keeps the get_record_top_k() best of each.
+
+        :param self: Represent the instance of the class
+        :param shard: The shard to write to
+        :param many_scores: A dictionary of product id to a non-empty list
+            of (product_id, score)
+        :return: Nothing
+        """
+        with shard.r.pipeline(transaction=False) as pipe:
+            for product_id, scores in many_scores.items():
+                key = shard.get_product_key(product_id)
+                tmp_key = f"tmp:move:{product_id}"
+                pipe.zadd(tmp_key, dict(scores))
+                pipe.zunionstore(key, [key, tmp_key])
+                pipe.delete(tmp_key)
+                pipe.zremrangebyrank(key, 0, -get_record_top_k() - 1)
+                pipe.incr(shard.get_version_key(product_id))
+            pipe.execute()
@@ -1,16 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
 import redis
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils.translation import get_language
+
+from .circuitbreaker import CircuitBreaker
+from .models import Product, Recommendation
+from .purchases import get_purchase_storage
+
+
+class RecommendationCache:
+    """
+    A bounded LRU cache of recommended products in the memory of the
+    process. Entries expire after a timeout and are stale as soon as the
+    co-purchase version of one of their products changes.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, versions):
+        """
+        The get function returns the cached value of the key,
+        or None when it is missing, expired or stale.
+
+        :param self: Represent the instance of the class
+        :param key: The key of the entry
+        :param versions: The current co-purchase versions of its products
+        :return: The cached value or None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, entry_versions, value = entry
+                if expires > time.monotonic() and entry_versions == versions:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
 
-from .models import Product
+    def set(self, key, versions, value):
+        with self.lock:
+            self.entries[key] = (
+                time.monotonic() + self.timeout,
+                versions,
+                value,
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                # drop the least recently used entry
+                self.entries.popitem(last=False)
 
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
 
-# connect to redis
-r = redis.Redis(
-    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
+    def info(self):
+        """
+        The info function returns the hit and miss counters of the cache.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+            }
+
+
+recommendations = RecommendationCache(
+    settings.RECOMMENDER_CACHE_SIZE, settings.RECOMMENDER_CACHE_TIMEOUT
+)
+
+# recommendations are read from the snapshot while the Redis storages
+# fail, other errors, e.g. of Postgres or bugs, are raised as usual
+breaker = CircuitBreaker(
+    "recommender",
+    settings.RECOMMENDER_BREAKER_THRESHOLD,
+    settings.RECOMMENDER_BREAKER_TIMEOUT,
+    errors=redis.RedisError,
 )
 
 
 class Recommender:
+    """
+    Recommends the products that are bought together. The co-purchase
+    scores are kept by the storage picked by the RECOMMENDER_STORAGE
+    setting, see shop.purchases.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or get_purchase_storage()
+
     def get_products_ids(self, products):
         """
         The get_products_ids function takes a list of products and returns a list of their ids.
@@ -21,89 +116,272 @@ class Recommender:
         """
         return [product.id for product in products]
 
-    def get_product_key(self, id):
-        """
-        The get_product_key function takes in a product id and returns the key for that product's purchased_with field.
-        The purchased_with field is a set of all products that have been bought with this one.
-
-        :param self: Access the instance of the class
-        :param id: Get the product key
-        :return: A key that is used to store the ids of products purchased with a given product
-        """
-        return f"product:{id}:purchased_with"
-
-    def products_bought(self, products):
+    def products_bought(self, products, order_id=None):
         """
         The products_bought function takes a list of products and increments
         the score for each product purchased together.
+        When the order id is given, orders that were already recorded are
+        skipped, e.g. on a webhook retry.
+        Twice the RECOMMENDER_TOP_K best scores of each product are kept,
+        trim_purchases cuts them to RECOMMENDER_TOP_K.
 
         :param self: Represent the instance of the class
         :param products: Pass in a list of products that were bought together
-        :return: The products that were bought together
+        :param order_id: The id of the order the products were bought in
+        :return: False if the order was already recorded, True otherwise
         """
-        products_ids = self.get_products_ids(products)
-        for product_id in products_ids:
-            for with_id in products_ids:
-                # get the other products bought with each product
-                if product_id != with_id:
-                    # increment score for product purchased together
-                    r.zincrby(self.get_product_key(product_id), 1, with_id)
+        return self.storage.record(
+            self.get_products_ids(products), order_id=order_id
+        )
 
     def suggest_products_for(self, products, max_results=6):
         """
         The suggest_products_for function takes a list of products and returns
-        a list of suggested products. The function uses the Redis sorted set data
-        structure to store product ids as keys, and their scores as values.
-        The score is calculated by adding up the number of times each product
-        has been purchased together with other products in the same order.
+        a list of suggested products. The score is calculated by adding up
+        the number of times each product has been purchased together with
+        other products in the same order.
         If only one product is passed to suggest_products_for, it will return
-        all other products that have been purchased together with it (descending order).
-        If more than one product is passed, it will return all other products that have
-        been purchased together with any of them (descending order).
+        the products that have been purchased together with it most often.
+        If more than one product is passed, it will return the products that have
+        been purchased together with any of them most often.
+        When there are too few of those, the list is filled up with the
+        products that are the most similar to the given ones, see
+        shop.similarity.
+        Only the top of the scores is read, unavailable products are skipped.
+        The result is cached in the process until the co-purchase scores
+        of the given products change, see RecommendationCache.
+        While the storage fails the suggestions are read from the snapshot
+        in Postgres instead, see CircuitBreaker.
 
         :param self: Make the function a method of the recommender class
         :param products: Get the products that we want to recommend similar products for
         :param max_results: Limit the number of results returned
         :return: A list of suggested products
         """
-        product_ids = self.get_products_ids(products)
-        if len(products) == 1:
-            # only 1 product
-            suggestions = r.zrange(
-                self.get_product_key(product_ids[0]), 0, -1, desc=True
-            )[:max_results]
-        else:
-            # generate a temporary key
-            flat_ids = "".join([str(id) for id in product_ids])
-            tmp_key = f"tmp_{flat_ids}"
-            # multiple products, combine scores of all products
-            # store the resulting sorted set in a temporary key
-            keys = [self.get_product_key(id) for id in product_ids]
-            r.zunionstore(tmp_key, keys)
-            # remove ids for the products the recommendation is for
-            r.zrem(tmp_key, *product_ids)
-            # get the product ids by their score, descendant sort
-            suggestions = r.zrange(tmp_key, 0, -1, desc=True)[:max_results]
-            # remove the temporary key
-            r.delete(tmp_key)
-        suggested_products_ids = [int(id) for id in suggestions]
-        # get suggested products and sort by order of appearance
+        product_ids = sorted(set(self.get_products_ids(products)))
+        if not product_ids:
+            return []
         suggested_products = list(
-            Product.objects.filter(id__in=suggested_products_ids)
-        )
-        suggested_products.sort(
-            key=lambda x: suggested_products_ids.index(x.id)
+            breaker.call(
+                self.get_cached_suggestions,
+                self.get_snapshot_suggestions,
+                product_ids,
+                max_results,
+            )
         )
+        if len(suggested_products) < max_results:
+            # new products have no co-purchases yet, fill up with the
+            # products that are described alike
+            suggested_products += self.get_similar_products(
+                product_ids,
+                max_results - len(suggested_products),
+                exclude_ids=self.get_products_ids(suggested_products),
+            )
         return suggested_products
 
-    def clear_purchases(self):
+    def get_cached_suggestions(self, product_ids, max_results):
         """
-        The clear_purchases function clears the purchases for a given user.
-        It does this by deleting all keys in Redis that start with the prefix 'purchases:'.
+        The get_cached_suggestions function returns the cached suggestions
+        for the given product ids while their versions didn't change,
+        or reads them from the storage.
 
+        :param self: Represent the instance of the class
+        :param product_ids: The sorted ids of the products to recommend for
+        :param max_results: Limit the number of results returned
+        :return: A list of suggested products
+        """
+        key = (tuple(product_ids), get_language(), max_results)
+        versions = self.storage.get_versions(product_ids)
+        suggested_products = recommendations.get(key, versions)
+        if suggested_products is None:
+            suggested_products = self.get_suggestions(product_ids, max_results)
+            recommendations.set(key, versions, suggested_products)
+        return suggested_products
 
-        :param self: Refer to the object that is calling the function
+    def get_suggestions(self, product_ids, max_results):
+        """
+        The get_suggestions function reads the top suggestions for the given
+        product ids from the storage and loads the available products.
+
+        :param self: Represent the instance of the class
+        :param product_ids: The ids of the products to recommend for
+        :param max_results: Limit the number of results returned
+        :return: A list of suggested products
+        """
+        # fetch a few more ids to make up for unavailable products
+        count = max_results + settings.RECOMMENDER_OVERFETCH
+        suggestions = self.storage.get_top(product_ids, count)
+        positions = {int(id): i for i, id in enumerate(suggestions)}
+        # get suggested products and sort by order of appearance
+        suggested_products = sorted(
+            Product.objects.prefetch_translations().filter(
+                id__in=positions, available=True
+            ),
+            key=lambda product: positions[product.id],
+        )
+        return suggested_products[:max_results]
+
+    def get_snapshot_suggestions(self, product_ids, max_results):
+        """
+        The get_snapshot_suggestions function sums the snapshot scores of
+        the given product ids and loads the best available products,
+        in a single query.
+
+        :param self: Represent the instance of the class
+        :param product_ids: The ids of the products to recommend for
+        :param max_results: Limit the number of results returned
+        :return: A list of suggested products
+        """
+        return list(
+            Product.objects.prefetch_translations()
+            .filter(available=True, recommended_by__product__in=product_ids)
+            .exclude(id__in=product_ids)
+            .annotate(snapshot_score=Sum("recommended_by__score"))
+            .order_by("-snapshot_score", "-id")[:max_results]
+        )
+
+    def get_similar_products(self, product_ids, count, exclude_ids=()):
+        """
+        The get_similar_products function sums the similarity of the
+        products to the given ones and loads the best available products,
+        in a single query.
+
+        :param self: Represent the instance of the class
+        :param product_ids: The ids of the products to find similar ones for
+        :param count: The maximum number of products returned
+        :param exclude_ids: The ids of other products that are left out
+        :return: A list of products
+        """
+        return list(
+            Product.objects.prefetch_translations()
+            .filter(available=True, similar_to__product__in=product_ids)
+            .exclude(id__in=[*product_ids, *exclude_ids])
+            .annotate(similarity=Sum("similar_to__score"))
+            .order_by("-similarity", "-id")[:count]
+        )
+
+    def save_snapshot(self, count, batch_size=500):
+        """
+        The save_snapshot function copies the count best co-purchases of
+        every product from the storage into the Recommendation table.
+        The rows of a batch of products are replaced in a transaction,
+        so the snapshot of a product is never half written.
+
+        :param self: Represent the instance of the class
+        :param count: The number of recommendations kept per product
+        :param batch_size: The number of products per round trip
+        :return: The number of products with recommendations
+        """
+        saved = 0
+        products_ids = (
+            Product.objects.order_by("id")
+            .values_list("id", flat=True)
+            .iterator(chunk_size=batch_size)
+        )
+        while batch := list(islice(products_ids, batch_size)):
+            many_scores = self.storage.get_many_scores(batch, count)
+            # scores of deleted products are left out
+            recommended = set(
+                Product.objects.filter(
+                    id__in={
+                        id
+                        for scores in many_scores.values()
+                        for id, _ in scores
+                    }
+                ).values_list("id", flat=True)
+            )
+            rows = [
+                Recommendation(
+                    product_id=product_id, recommended_id=id, score=score
+                )
+                for product_id, scores in many_scores.items()
+                for id, score in scores
+                if id in recommended
+            ]
+            with transaction.atomic():
+                Recommendation.objects.filter(product_id__in=batch).delete()
+                Recommendation.objects.bulk_create(rows)
+            saved += len({row.product_id for row in rows})
+        return saved
+
+    def load_purchases(self, scores, batch_size=500):
+        """
+        The load_purchases function replaces the co-purchase scores of
+        products, e.g. with the scores rebuilt from the order history.
+
+        :param self: Represent the instance of the class
+        :param scores: An iterable of (product_id, [(with_id, score), ...]),
+            a product with no scores is cleared
+        :param batch_size: The number of products written at once
+        :return: The number of products loaded
+        """
+        return self.storage.load(scores, batch_size=batch_size)
+
+    def set_decayed_at(self, timestamp):
+        """
+        The set_decayed_at function records that the scores are up to date
+        at the given time, e.g. after they were rebuilt with decayed weights.
+
+        :param self: Represent the instance of the class
+        :param timestamp: A unix timestamp
         :return: Nothing
         """
-        for id in Product.objects.values_list("id", flat=True):
-            r.delete(self.get_product_key(id))
+        self.storage.set_decayed_at(timestamp)
+
+    def decay_purchases(self, half_life, min_score, batch_size=500):
+        """
+        The decay_purchases function scales every co-purchase score down by
+        the time passed since the previous decay, so a score halves every
+        half_life seconds and recent baskets outweigh old ones. Scores that
+        fall below min_score are dropped. The first call only records
+        the time.
+
+        :param self: Represent the instance of the class
+        :param half_life: The half-life of a score in seconds
+        :param min_score: The smallest score that is kept
+        :param batch_size: The number of products decayed at once
+        :return: The number of products that were decayed
+        """
+        return self.storage.decay(half_life, min_score, batch_size=batch_size)
+
+    def trim_purchases(self, top_k, batch_size=500):
+        """
+        The trim_purchases function drops all but the top_k best scores of
+        every product, e.g. after the cap was lowered.
+
+        :param self: Represent the instance of the class
+        :param top_k: The number of scores kept per product
+        :param batch_size: The number of products trimmed at once
+        :return: The number of scores that were dropped
+        """
+        return self.storage.trim(top_k, batch_size=batch_size)
+
+    def iter_purchase_sizes(self, batch_size=500):
+        """
+        The iter_purchase_sizes function returns the number of scores and
+        the memory used by every product that has scores.
+
+        :param self: Represent the instance of the class
+        :param batch_size: The number of products read at once
+        :return: A generator of (name, members, bytes)
+        """
+        return self.storage.iter_sizes(batch_size=batch_size)
+
+    def clear_purchases(
+        self, products_ids=None, batch_size=500, progress=None
+    ):
+        """
+        The clear_purchases function deletes the co-purchase scores of the
+        given products, or of every product, in batches.
+        Cached recommendations of the products go stale.
+
+        :param self: Refer to the object that is calling the function
+        :param products_ids: The ids of the products to clear, all by default
+        :param batch_size: The number of products per batch
+        :param progress: Called with the number of products done so far
+            after every batch
+        :return: The number of products that had scores
+        """
+        return self.storage.clear(
+            products_ids, batch_size=batch_size, progress=progress
+        )
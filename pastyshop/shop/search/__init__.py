@@ -0,0 +1,20 @@
+from functools import cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import SearchBackend, SearchResult, get_products
+from .cached import CachedSearchBackend
+
+
+@cache
+def get_search_backend():
+    """
+    The get_search_backend function returns the search engine of this
+    process, picked by the SEARCH_BACKEND setting. Its results are cached
+    unless SEARCH_CACHE_TIMEOUT is 0.
+    """
+    backend = import_string(settings.SEARCH_BACKEND)()
+    if settings.SEARCH_CACHE_TIMEOUT:
+        backend = CachedSearchBackend(backend)
+    return backend
@@ -0,0 +1,124 @@
+import re
+from collections import namedtuple
+
+from django.urls import reverse
+
+from ..models import Product
+
+WORD_RE = re.compile(r"\w+(?:'\w+)*")
+APOSTROPHES = str.maketrans({"’": "'", "ʼ": "'", "`": "'"})
+
+
+def tokenize(text):
+    """
+    The tokenize function splits a text into lowercase words.
+    Apostrophes inside a word are kept, so "м'ясо" stays a single term.
+    """
+    return WORD_RE.findall((text or "").lower().translate(APOSTROPHES))
+
+
+# a ranked match, results are ordered by (-rank, -id)
+SearchResult = namedtuple("SearchResult", ["id", "rank"])
+
+
+class SearchBackend:
+    """
+    The interface of the product search engines. A backend returns ranked
+    product ids, the products themselves are loaded by get_products in a
+    single query, only for the results that are displayed.
+    """
+
+    def search(self, query, language):
+        """
+        The search function returns the products that match the query.
+
+        :param self: Represent the instance of the class
+        :param query: The text the customer is looking for
+        :param language: The language code of the translations to search
+        :return: A list of SearchResult, best matches first
+        """
+        raise NotImplementedError
+
+    def normalize(self, query, language):
+        """
+        The normalize function returns a key that is the same for every
+        query with the same results, e.g. "Вареники  " and "вареники".
+
+        :param self: Represent the instance of the class
+        :param query: The text the customer is looking for
+        :param language: The language code of the translations to search
+        :return: A string
+        """
+        return " ".join(sorted(set(tokenize(query))))
+
+    def suggest(self, query, language, limit):
+        """
+        The suggest function returns the products and categories for the
+        autocomplete of the search box.
+
+        :param self: Represent the instance of the class
+        :param query: The text typed into the search box so far
+        :param language: The language code of the translations to search
+        :param limit: The maximum number of products and of categories
+        :return: A dictionary with lists of product and category suggestions
+        """
+        raise NotImplementedError
+
+    def update_product(self, product):
+        """
+        Called when a product is saved, backends that keep
+        their own index update it here.
+        """
+
+    def remove_product(self, product):
+        """
+        Called when a product is deleted.
+        """
+
+
+def get_products(results):
+    """
+    The get_products function loads the products of the given search results
+    and their translations with a single id__in query, keeps their order
+    and sets the rank on them.
+
+    :param results: A list of SearchResult
+    :return: A list of products
+    """
+    products = Product.objects.prefetch_translations().in_bulk(
+        [result.id for result in results]
+    )
+    found = []
+    for result in results:
+        product = products.get(result.id)
+        if product is not None:
+            product.rank = result.rank
+            found.append(product)
+    return found
+
+
+def format_suggestions(products, categories):
+    """
+    The format_suggestions function turns matched names into the JSON
+    payload of the suggest endpoint.
+
+    :param products: (id, name, slug) of the matched products
+    :param categories: (name, slug) of the matched categories
+    :return: A dictionary with lists of product and category suggestions
+    """
+    return {
+        "products": [
+            {
+                "name": name,
+                "url": reverse("shop:product_detail", args=[id, slug]),
+            }
+            for id, name, slug in products
+        ],
+        "categories": [
+            {
+                "name": name,
+                "url": reverse("shop:product_list_by_category", args=[slug]),
+            }
+            for name, slug in categories
+        ],
+    }
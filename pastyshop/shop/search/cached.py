@@ -0,0 +1,100 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .base import SearchBackend, SearchResult
+
+GENERATION_KEY = "search:generation"
+
+
+class CachedSearchBackend(SearchBackend):
+    """
+    Cache the ranked results of another backend per language and
+    normalized query, so popular queries are ranked once.
+    A product change starts a new cache generation, this also covers
+    products that start matching a query they did not match before.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_generation(self):
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            cache.add(GENERATION_KEY, 1, None)
+            generation = cache.get(GENERATION_KEY, 1)
+        return generation
+
+    def invalidate(self):
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.add(GENERATION_KEY, 1, None)
+
+    def get_results_key(self, normalized, language):
+        """
+        The get_results_key function returns the cache key of the ranked
+        results of a normalized query, hashed so any query is a valid key.
+
+        :param self: Represent the instance of the class
+        :param normalized: The key returned by normalize
+        :param language: The language code of the search
+        :return: A cache key
+        """
+        digest = hashlib.md5(normalized.encode()).hexdigest()
+        return f"search:{self.get_generation()}:{language}:{digest}"
+
+    def search(self, query, language):
+        """
+        The search function returns the cached results of the normalized
+        query. On a miss only one worker ranks the query, the others wait
+        for its result for up to SEARCH_CACHE_LOCK_TIMEOUT seconds instead
+        of running the same query at the same time.
+        """
+        normalized = self.backend.normalize(query, language)
+        if not normalized:
+            return []
+        key = self.get_results_key(normalized, language)
+        results = cache.get(key)
+        if results is not None:
+            return [SearchResult(*result) for result in results]
+
+        lock_key = f"{key}:lock"
+        timeout = settings.SEARCH_CACHE_LOCK_TIMEOUT
+        locked = cache.add(lock_key, 1, timeout)
+        if not locked:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                results = cache.get(key)
+                if results is not None:
+                    return [SearchResult(*result) for result in results]
+        try:
+            results = self.backend.search(query, language)
+            cache.set(
+                key,
+                [tuple(result) for result in results],
+                settings.SEARCH_CACHE_TIMEOUT,
+            )
+        finally:
+            # a worker that gave up waiting must not release the lock of
+            # the worker that is still ranking the query
+            if locked:
+                cache.delete(lock_key)
+        return results
+
+    def normalize(self, query, language):
+        return self.backend.normalize(query, language)
+
+    def suggest(self, query, language, limit):
+        return self.backend.suggest(query, language, limit)
+
+    def update_product(self, product):
+        self.backend.update_product(product)
+        self.invalidate()
+
+    def remove_product(self, product):
+        self.backend.remove_product(product)
+        self.invalidate()
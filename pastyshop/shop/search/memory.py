@@ -0,0 +1,296 @@
+import math
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from django.conf import settings
+
+from ..models import Category, Product
+from .base import SearchBackend, SearchResult, format_suggestions, tokenize
+
+
+class InvertedIndex:
+    """
+    A compact inverted index with BM25 scoring.
+    The postings of every term are two parallel arrays, the sorted document
+    ids and the term frequencies, so the index costs a few bytes per posting
+    instead of a Python object.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_lengths
+
+    def add(self, doc_id, fields):
+        """
+        The add function indexes a document, replacing its previous version.
+
+        :param self: Represent the instance of the class
+        :param doc_id: The id of the document
+        :param fields: A list of (text, weight) pairs, a term found in a field
+            counts weight times towards its frequency
+        :return: Nothing
+        """
+        self.remove(doc_id)
+        frequencies = Counter()
+        for text, weight in fields:
+            for term in tokenize(text):
+                frequencies[term] += weight
+        if not frequencies:
+            return
+        for term, frequency in frequencies.items():
+            if term not in self.postings:
+                self.postings[term] = (array("q"), array("I"))
+                self._vocabulary = None
+            ids, frequencies_ = self.postings[term]
+            position = bisect_left(ids, doc_id)
+            ids.insert(position, doc_id)
+            frequencies_.insert(position, frequency)
+        length = sum(frequencies.values())
+        self.doc_terms[doc_id] = tuple(frequencies)
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id):
+        """
+        The remove function drops a document from the postings of its terms.
+
+        :param self: Represent the instance of the class
+        :param doc_id: The id of the document
+        :return: Nothing
+        """
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            ids, frequencies = self.postings[term]
+            position = bisect_left(ids, doc_id)
+            del ids[position]
+            del frequencies[position]
+            if not ids:
+                del self.postings[term]
+                self._vocabulary = None
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def get_ids(self, term):
+        postings = self.postings.get(term)
+        return postings[0] if postings else array("q")
+
+    def get_frequency(self, term, doc_id):
+        ids, frequencies = self.postings[term]
+        position = bisect_left(ids, doc_id)
+        if position < len(ids) and ids[position] == doc_id:
+            return frequencies[position]
+        return 0
+
+    def search(self, query):
+        """
+        The search function returns the documents that contain every term
+        of the query, scored with BM25.
+
+        :param self: Represent the instance of the class
+        :param query: The text to look for
+        :return: A list of (doc_id, score) pairs, best matches first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or any(term not in self.postings for term in terms):
+            return []
+        # walk the shortest postings list, look the others up by bisection
+        terms.sort(key=lambda term: len(self.postings[term][0]))
+        count = len(self.doc_lengths)
+        average_length = self.total_length / count
+        idf = {}
+        for term in terms:
+            df = len(self.postings[term][0])
+            idf[term] = math.log(1 + (count - df + 0.5) / (df + 0.5))
+
+        scores = []
+        for doc_id in self.postings[terms[0]][0]:
+            norm = self.k1 * (
+                1 - self.b + self.b * self.doc_lengths[doc_id] / average_length
+            )
+            score = 0.0
+            for term in terms:
+                frequency = self.get_frequency(term, doc_id)
+                if not frequency:
+                    break
+                score += (
+                    idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+                )
+            else:
+                scores.append((doc_id, score))
+        scores.sort(key=lambda item: (-item[1], -item[0]))
+        return scores
+
+    def complete(self, prefix):
+        """
+        The complete function returns the ids of the documents that contain
+        a term starting with the prefix.
+
+        :param self: Represent the instance of the class
+        :param prefix: The beginning of a term
+        :return: A set of document ids
+        """
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        start = bisect_left(self._vocabulary, prefix)
+        end = bisect_right(self._vocabulary, prefix + "\uffff")
+        doc_ids = set()
+        for term in self._vocabulary[start:end]:
+            doc_ids.update(self.postings[term][0])
+        return doc_ids
+
+
+class InMemorySearchBackend(SearchBackend):
+    """
+    Search without Postgres full-text search, for edge nodes and tests.
+    The index lives in the memory of the process, it is built from the
+    product translations on first use and kept up to date by the product
+    signals. Ukrainian and English text is matched without stemming.
+    Categories are read when the index is built.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.indexes = None
+
+    def build(self):
+        """
+        The build function indexes every available product, one inverted
+        index for the full text and one for the names of each language.
+
+        :param self: Represent the instance of the class
+        :return: Nothing
+        """
+        ProductTranslation = Product._parler_meta.root_model
+        CategoryTranslation = Category._parler_meta.root_model
+        indexes = {
+            language: {
+                "text": InvertedIndex(),
+                "names": InvertedIndex(),
+                "products": {},
+                "categories": [],
+            }
+            for language, _ in settings.LANGUAGES
+        }
+        translations = ProductTranslation.objects.filter(
+            master__available=True
+        ).values_list(
+            "master_id",
+            "language_code",
+            "name",
+            "slug",
+            "description",
+            "mini_description",
+        )
+        for id, language, *fields in translations:
+            if language in indexes:
+                self._add(indexes[language], id, *fields)
+        categories = CategoryTranslation.objects.values_list(
+            "language_code", "name", "slug"
+        )
+        for language, name, slug in categories:
+            if language in indexes:
+                indexes[language]["categories"].append((name, slug))
+        self.indexes = indexes
+
+    def _add(self, index, id, name, slug, description, mini_description):
+        # the name weighs like "A" and the descriptions like "B" in Postgres
+        index["text"].add(
+            id, [(name, 2), (description, 1), (mini_description, 1)]
+        )
+        index["names"].add(id, [(name, 1)])
+        index["products"][id] = (name, slug)
+
+    def _remove(self, index, id):
+        index["text"].remove(id)
+        index["names"].remove(id)
+        index["products"].pop(id, None)
+
+    def get_indexes(self):
+        with self.lock:
+            if self.indexes is None:
+                self.build()
+            return self.indexes
+
+    def search(self, query, language):
+        index = self.get_indexes().get(language)
+        if index is None:
+            return []
+        with self.lock:
+            results = index["text"].search(query)
+        return [
+            SearchResult(*result)
+            for result in results[: settings.SEARCH_MAX_RESULTS]
+        ]
+
+    def suggest(self, query, language, limit):
+        """
+        The suggest function returns the products with a name term starting
+        with the last word of the query and containing the other words,
+        shortest names first. Misspellings are not corrected.
+        """
+        index = self.get_indexes().get(language)
+        terms = tokenize(query)
+        if index is None or not terms:
+            return format_suggestions([], [])
+        with self.lock:
+            doc_ids = index["names"].complete(terms[-1])
+            for term in terms[:-1]:
+                doc_ids.intersection_update(index["names"].get_ids(term))
+            products = sorted(
+                (
+                    (id, *index["products"][id])
+                    for id in doc_ids
+                    if id in index["products"]
+                ),
+                key=lambda product: (len(product[1]), product[1]),
+            )[:limit]
+        query = query.lower()
+        categories = [
+            (name, slug)
+            for name, slug in index["categories"]
+            if name.lower().startswith(query)
+        ][:limit]
+        return format_suggestions(products, categories)
+
+    def update_product(self, product):
+        """
+        The update_product function reindexes a saved product in every
+        language, or drops it when it is no longer available.
+        """
+        with self.lock:
+            if self.indexes is None:
+                return
+            for language, index in self.indexes.items():
+                if product.available and product.has_translation(language):
+                    translation = product.get_translation(language)
+                    self._add(
+                        index,
+                        product.id,
+                        translation.name,
+                        translation.slug,
+                        translation.description,
+                        translation.mini_description,
+                    )
+                else:
+                    self._remove(index, product.id)
+
+    def remove_product(self, product):
+        with self.lock:
+            if self.indexes is None:
+                return
+            for index in self.indexes.values():
+                self._remove(index, product.id)
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Upper
+
+from ..models import Category, Product
+from .base import SearchBackend, SearchResult, format_suggestions
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Full-text search over the stored, GIN indexed search vectors of the
+    product translations, suggestions come from the trigram indexes.
+    """
+
+    def get_queryset(self, query, language):
+        """
+        The get_queryset function matches the query against the stored search
+        vector of the product translations in the given language.
+        The rank is only computed for the rows that match the index, and it
+        is cast to double precision so it compares exactly in a cursor.
+
+        :param self: Represent the instance of the class
+        :param query: The text the customer is looking for
+        :param language: The language code of the translations to search
+        :return: A queryset of products annotated with rank, best matches first
+        """
+        search_query = SearchQuery(
+            query, config=settings.SEARCH_CONFIGS.get(language, "simple")
+        )
+        return (
+            Product.objects.filter(
+                available=True,
+                translations__language_code=language,
+                translations__search_vector=search_query,
+            )
+            .annotate(
+                rank=Cast(
+                    SearchRank(F("translations__search_vector"), search_query),
+                    FloatField(),
+                ),
+            )
+            .order_by("-rank", "-id")
+        )
+
+    def search(self, query, language):
+        results = self.get_queryset(query, language).values_list("id", "rank")
+        return [
+            SearchResult(*result)
+            for result in results[: settings.SEARCH_MAX_RESULTS]
+        ]
+
+    def suggest(self, query, language, limit):
+        """
+        The suggest function looks up product and category names that start
+        with or look like the query, so a misspelled name still finds something.
+        Both conditions are answered by the trigram GIN indexes on the
+        translated names, and only names and slugs are read.
+        """
+        ProductTranslation = Product._parler_meta.root_model
+        CategoryTranslation = Category._parler_meta.root_model
+        # both lookups match the trigram index on UPPER(name)
+        query = query.upper()
+        matches = Q(upper_name__startswith=query) | Q(
+            upper_name__trigram_similar=query
+        )
+        similarity = TrigramSimilarity("upper_name", query)
+
+        products = (
+            ProductTranslation.objects.annotate(upper_name=Upper("name"))
+            .filter(matches, language_code=language, master__available=True)
+            .annotate(similarity=similarity)
+            .order_by("-similarity", "name")
+            .values_list("master_id", "name", "slug")[:limit]
+        )
+        categories = (
+            CategoryTranslation.objects.annotate(upper_name=Upper("name"))
+            .filter(matches, language_code=language)
+            .annotate(similarity=similarity)
+            .order_by("-similarity", "name")
+            .values_list("name", "slug")[:limit]
+        )
+        return format_suggestions(products, categories)
@@ -0,0 +1,256 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from ordersapp.models import OrderItem
+from .models import Category, Product
+
+
+class Showcase:
+    def get_pool_key(self, language, category_id=None):
+        """
+        The get_pool_key function returns the cache key of the shuffled id pool
+        for a given language and category.
+
+        :param self: Represent the instance of the class
+        :param language: The language code the pool is built for
+        :param category_id: The category of the pool, None for the whole catalogue
+        :return: A key that is used to store the shuffled product ids
+        """
+        return f"showcase:{language}:{category_id or 'all'}"
+
+    def get_pool_keys(self):
+        """
+        The get_pool_keys function returns the keys of every pool that can exist,
+        one for each language and category plus the whole catalogue.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary that maps pool keys to (language, category_id) pairs
+        """
+        category_ids = [None] + list(
+            Category.objects.values_list("id", flat=True)
+        )
+        return {
+            self.get_pool_key(language, category_id): (language, category_id)
+            for language, _ in settings.LANGUAGES
+            for category_id in category_ids
+        }
+
+    def build_pool(self, language, category_id=None):
+        """
+        The build_pool function loads the ids of the available products,
+        shuffles them once and stores the result in the cache.
+        The pool expires after SHOWCASE_POOL_TIMEOUT seconds, so the
+        showcase is reshuffled periodically while pages stay stable in between.
+
+        :param self: Represent the instance of the class
+        :param language: Only products translated to this language are used
+        :param category_id: Limit the pool to a single category
+        :return: A list of shuffled product ids
+        """
+        products = Product.objects.filter(
+            available=True, translations__language_code=language
+        )
+        if category_id:
+            products = products.filter(category_id=category_id)
+        pool = list(products.values_list("id", flat=True))
+        random.shuffle(pool)
+        cache.set(
+            self.get_pool_key(language, category_id),
+            pool,
+            settings.SHOWCASE_POOL_TIMEOUT,
+        )
+        return pool
+
+    def get_pool(self, language, category_id=None):
+        """
+        The get_pool function returns the shuffled id pool from the cache,
+        building it first if it has expired.
+
+        :param self: Represent the instance of the class
+        :param language: The language code the pool is built for
+        :param category_id: The category of the pool, None for the whole catalogue
+        :return: A list of shuffled product ids
+        """
+        pool = cache.get(self.get_pool_key(language, category_id))
+        if pool is None:
+            pool = self.build_pool(language, category_id)
+        return pool
+
+    def get_products(self, products_ids):
+        """
+        The get_products function loads the available products with the
+        given ids with their translations and keeps the order of the ids.
+        A pool that still holds a product taken off sale shows one product
+        less until it is rebuilt.
+
+        :param self: Represent the instance of the class
+        :param products_ids: A list of product ids
+        :return: A list of products
+        """
+        products = (
+            Product.objects.prefetch_translations()
+            .filter(available=True)
+            .in_bulk(products_ids)
+        )
+        return [products[id] for id in products_ids if id in products]
+
+    def sample(self, language, count, category_id=None):
+        """
+        The sample function returns a few random available products without
+        asking the database to sort the whole catalogue.
+
+        :param self: Represent the instance of the class
+        :param language: The language code of the pool
+        :param count: The number of products to return
+        :param category_id: Limit the sample to a single category
+        :return: A list of products
+        """
+        pool = self.get_pool(language, category_id)
+        return self.get_products(random.sample(pool, min(count, len(pool))))
+
+    def get_bestsellers_key(self, category_id=None):
+        """
+        The get_bestsellers_key function returns the cache key of the
+        bestseller ids of a category.
+
+        :param self: Represent the instance of the class
+        :param category_id: The category, None for the whole catalogue
+        :return: A key that is used to store the ranked product ids
+        """
+        return f"bestsellers:{category_id or 'all'}"
+
+    def build_bestsellers(self):
+        """
+        The build_bestsellers function ranks the available products by the
+        quantity sold in the paid orders of the last BESTSELLERS_DAYS days,
+        with a single aggregate query, and stores the BESTSELLERS_POOL_SIZE
+        best ids of every category and of the whole catalogue in the cache.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary that maps bestseller keys to product ids
+        """
+        since = timezone.now() - timedelta(days=settings.BESTSELLERS_DAYS)
+        sales = (
+            OrderItem.objects.filter(
+                order__paid=True,
+                order__created__gte=since,
+                product__available=True,
+            )
+            .values_list("product_id", "product__category_id")
+            .annotate(sold=Sum("quantity"))
+            .order_by("-sold", "-product_id")
+        )
+        pools = defaultdict(list)
+        size = settings.BESTSELLERS_POOL_SIZE
+        for product_id, category_id, _ in sales:
+            for key in {None, category_id}:
+                if len(pools[key]) < size:
+                    pools[key].append(product_id)
+        # categories without sales get an empty pool, not a cache miss
+        category_ids = [None] + list(
+            Category.objects.values_list("id", flat=True)
+        )
+        bestsellers = {
+            self.get_bestsellers_key(category_id): pools[category_id]
+            for category_id in category_ids
+        }
+        cache.set_many(bestsellers, settings.BESTSELLERS_TIMEOUT)
+        return bestsellers
+
+    def get_bestsellers(self, category_id=None):
+        """
+        The get_bestsellers function returns the ranked bestseller ids of
+        a category from the cache. They are only built by the hourly
+        build_bestsellers task, a request never runs the aggregate, so
+        until the task ran there are no bestsellers.
+
+        :param self: Represent the instance of the class
+        :param category_id: The category, None for the whole catalogue
+        :return: A list of product ids, best selling first
+        """
+        return cache.get(self.get_bestsellers_key(category_id), [])
+
+    def sample_bestsellers(
+        self, language, count, category_id=None, exclude=()
+    ):
+        """
+        The sample_bestsellers function returns a few random bestsellers,
+        e.g. when there is nothing to recommend. Only the ids are sampled,
+        just the products that are returned are loaded. While there are
+        too few sales, the sample is filled up from the shuffled pool.
+
+        :param self: Represent the instance of the class
+        :param language: The language code of the shuffled pool
+        :param count: The number of products to return
+        :param category_id: Limit the sample to a single category
+        :param exclude: The ids of products that must not be returned
+        :return: A list of products
+        """
+        exclude = set(exclude)
+        pool = [
+            id for id in self.get_bestsellers(category_id) if id not in exclude
+        ]
+        products_ids = random.sample(pool, min(count, len(pool)))
+        if len(products_ids) < count:
+            exclude.update(pool)
+            pool = [
+                id
+                for id in self.get_pool(language, category_id)
+                if id not in exclude
+            ]
+            products_ids += random.sample(
+                pool, min(count - len(products_ids), len(pool))
+            )
+        return self.get_products(products_ids)
+
+    def update_product(self, product, deleted=False):
+        """
+        The update_product function keeps the cached pools in sync with a product.
+        A product that is no longer available (or deleted) is dropped from every pool
+        and from the bestsellers,
+        an available one is inserted at a random position of the pools it belongs to.
+        Other ids keep their positions, so the pages customers are browsing stay stable.
+
+        :param self: Represent the instance of the class
+        :param product: The product that was saved or deleted
+        :param deleted: Whether the product was deleted
+        :return: Nothing
+        """
+        pool_keys = self.get_pool_keys()
+        pools = cache.get_many(pool_keys.keys())
+        changed = {}
+        for key, pool in pools.items():
+            language, category_id = pool_keys[key]
+            wanted = (
+                not deleted
+                and product.available
+                and product.has_translation(language)
+                and category_id in (None, product.category_id)
+            )
+            if wanted and product.id not in pool:
+                pool.insert(random.randint(0, len(pool)), product.id)
+                changed[key] = pool
+            elif not wanted and product.id in pool:
+                pool.remove(product.id)
+                changed[key] = pool
+        if changed:
+            cache.set_many(changed, settings.SHOWCASE_POOL_TIMEOUT)
+        if deleted or not product.available:
+            # bestsellers are only added back by build_bestsellers
+            keys = {
+                self.get_bestsellers_key(),
+                self.get_bestsellers_key(product.category_id),
+            }
+            changed = {
+                key: [id for id in bestsellers if id != product.id]
+                for key, bestsellers in cache.get_many(keys).items()
+                if product.id in bestsellers
+            }
+            if changed:
+                cache.set_many(changed, settings.BESTSELLERS_TIMEOUT)
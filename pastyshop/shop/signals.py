@@ -0,0 +1,143 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Comment, Product
+from .search import get_search_backend
+from .showcase import Showcase
+from .tasks import update_similar_products
+
+ProductTranslation = Product._parler_meta.root_model
+
+
+def queue_similar_products_update(product_id):
+    # the saves of a product and its translations within
+    # SIMILAR_PRODUCTS_UPDATE_DELAY seconds are refreshed by a single task
+    def queue():
+        key = f"similar_products:pending:{product_id}"
+        delay = settings.SIMILAR_PRODUCTS_UPDATE_DELAY
+        if cache.add(key, 1, delay + 60):
+            update_similar_products.apply_async((product_id,), countdown=delay)
+
+    transaction.on_commit(queue)
+
+
+def queue_search_update(product_id):
+    # parler saves the translations after the post_save of the product,
+    # the search index and the cached results are refreshed once they are
+    # committed too
+    def update():
+        product = Product.objects.filter(id=product_id).first()
+        if product is not None:
+            get_search_backend().update_product(product)
+
+    transaction.on_commit(update)
+
+
+@receiver(pre_save, sender=Product)
+def product_saving(sender, instance, **kwargs):
+    """
+    Remember whether the category of a product changes, the similar
+    products are not refreshed when only the price or the stock did.
+    """
+    instance._category_changed = (
+        instance._state.adding
+        or not Product.objects.filter(
+            id=instance.id, category_id=instance.category_id
+        ).exists()
+    )
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    """
+    Keep the random showcase pools and the search index
+    in sync when a product is saved, and refresh the similar products
+    when its category changed.
+    """
+    Showcase().update_product(instance)
+    get_search_backend().update_product(instance)
+    if getattr(instance, "_category_changed", True):
+        queue_similar_products_update(instance.id)
+
+
+@receiver(pre_save, sender=ProductTranslation)
+def product_translation_saving(sender, instance, **kwargs):
+    """
+    Remember whether the text of a product translation changes.
+    """
+    instance._text_changed = (
+        instance._state.adding
+        or not ProductTranslation.objects.filter(
+            id=instance.id,
+            name=instance.name,
+            description=instance.description,
+            mini_description=instance.mini_description,
+        ).exists()
+    )
+
+
+@receiver(post_save, sender=ProductTranslation)
+def product_translation_saved(sender, instance, **kwargs):
+    """
+    Refresh the search results and the similar products once the text
+    of a product changed.
+    """
+    if getattr(instance, "_text_changed", True):
+        queue_search_update(instance.master_id)
+        queue_similar_products_update(instance.master_id)
+
+
+@receiver(post_delete, sender=ProductTranslation)
+def product_translation_deleted(sender, instance, **kwargs):
+    queue_search_update(instance.master_id)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    """
+    Drop a deleted product from the random showcase pools, from the
+    search index and from the vectors of the similar products.
+    """
+    Showcase().update_product(instance, deleted=True)
+    get_search_backend().remove_product(instance)
+    queue_similar_products_update(instance.id)
+
+
+def update_comment_count(product_id, delta):
+    # a single UPDATE, concurrent comments can't overwrite each other
+    if delta:
+        Product.objects.filter(id=product_id).update(
+            active_comment_count=F("active_comment_count") + delta
+        )
+
+
+@receiver(pre_save, sender=Comment)
+def comment_saving(sender, instance, **kwargs):
+    """
+    Remember whether a moderated comment was active before it is saved.
+    """
+    instance._was_active = (
+        not instance._state.adding
+        and Comment.objects.filter(id=instance.id, active=True).exists()
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, **kwargs):
+    """
+    Count a new active comment, or a comment that was approved or hidden
+    by a moderator, in the active_comment_count of its product.
+    """
+    update_comment_count(
+        instance.product_id, instance.active - instance._was_active
+    )
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.active:
+        update_comment_count(instance.product_id, -1)
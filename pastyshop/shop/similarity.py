@@ -0,0 +1,316 @@
+from collections import Counter, defaultdict
+from itertools import islice
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min
+from scipy import sparse
+
+from .copurchases import iter_top
+from .models import Category, Product, SimilarProduct
+from .search.base import tokenize
+
+# the vocabulary, the IDF weights and the vectors of the last rebuild,
+# a saved product is compared to the other products with them. They are
+# kept in the shared cache, so every worker updates the same model
+MODEL_KEY = "similarity:model"
+MODEL_LOCK_KEY = "similarity:model:lock"
+MODEL_LOCK_TIMEOUT = 60
+
+
+class ModelLocked(Exception):
+    """
+    Another worker is updating the cached vectors.
+    """
+
+
+def get_documents(products_ids=None):
+    """
+    The get_documents function collects the text of every product, the
+    name, the descriptions and the category in every language, as weighted
+    fields. The products of a category share a term for it, so they are
+    a little similar even when their names are not.
+
+    :param products_ids: Only collect the text of these products
+    :return: A dictionary of product id to a list of (text, weight) pairs
+    """
+    ProductTranslation = Product._parler_meta.root_model
+    CategoryTranslation = Category._parler_meta.root_model
+    products = Product.objects.all()
+    translations = ProductTranslation.objects.all()
+    category_translations = CategoryTranslation.objects.all()
+    if products_ids is not None:
+        products = products.filter(id__in=products_ids)
+        translations = translations.filter(master_id__in=products_ids)
+        category_translations = category_translations.filter(
+            master__products__in=products_ids
+        )
+    categories = defaultdict(list)
+    for category_id, name in category_translations.values_list(
+        "master_id", "name"
+    ):
+        categories[category_id].append((name, 1))
+    documents = {}
+    for id, category_id in products.values_list("id", "category_id"):
+        documents[id] = [(f"category{category_id}", 2)] if category_id else []
+        documents[id] += categories[category_id]
+    translations = translations.values_list(
+        "master_id", "name", "description", "mini_description"
+    )
+    for id, name, description, mini_description in translations:
+        if id in documents:
+            documents[id] += [
+                (name, 2),
+                (description, 1),
+                (mini_description, 1),
+            ]
+    return documents
+
+
+def get_term_counts(documents, vocabulary):
+    """
+    The get_term_counts function counts the weighted terms of documents.
+
+    :param documents: A list of lists of (text, weight) pairs
+    :param vocabulary: A dictionary of term to column, new terms are added
+    :return: A CSR matrix with a row per document
+    """
+    rows = []
+    columns = []
+    frequencies = []
+    for row, fields in enumerate(documents):
+        counts = Counter()
+        for text, weight in fields:
+            for term in tokenize(text):
+                counts[term] += weight
+        for term, count in counts.items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            frequencies.append(count)
+    return sparse.csr_matrix(
+        (np.array(frequencies, dtype=np.float64), (rows, columns)),
+        shape=(len(documents), len(vocabulary)),
+    )
+
+
+def get_idf(counts):
+    """
+    The get_idf function returns the smoothed inverse document frequency
+    of every column of the term counts.
+    """
+    document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+    return np.log((1 + counts.shape[0]) / (1 + document_frequency)) + 1
+
+
+def weigh(counts, idf):
+    """
+    The weigh function turns term counts into TF-IDF vectors of unit
+    length, so the dot product of two vectors is their cosine similarity.
+    The term frequencies are dampened with a logarithm, a description that
+    repeats a word ten times is not ten times more about it.
+
+    :param counts: A CSR matrix of term counts
+    :param idf: The IDF weight of every column
+    :return: A CSR matrix with a row per document
+    """
+    vectors = counts.copy()
+    vectors.data = 1 + np.log(vectors.data)
+    vectors = vectors @ sparse.diags(idf, format="csr")
+    norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return (sparse.diags(1 / norms, format="csr") @ vectors).tocsr()
+
+
+def get_vectors(documents):
+    """
+    The get_vectors function turns documents into TF-IDF vectors of unit
+    length with the IDF weights of the documents.
+
+    :param documents: A list of lists of (text, weight) pairs
+    :return: A CSR matrix with a row per document
+    """
+    counts = get_term_counts(documents, {})
+    return weigh(counts, get_idf(counts))
+
+
+def get_similarities(vectors, rows, min_score):
+    """
+    The get_similarities function returns the cosine similarity of the
+    given rows to every other row.
+
+    :param vectors: A CSR matrix of unit vectors
+    :param rows: The positions of the rows to compare
+    :param min_score: Smaller similarities are left out
+    :return: A CSR matrix with a row per given row
+    """
+    rows = np.asarray(rows)
+    similarities = (vectors[rows] @ vectors.T).tocoo()
+    # a product is not similar to itself
+    keep = (similarities.col != rows[similarities.row]) & (
+        similarities.data >= min_score
+    )
+    return sparse.csr_matrix(
+        (
+            similarities.data[keep],
+            (similarities.row[keep], similarities.col[keep]),
+        ),
+        shape=similarities.shape,
+    )
+
+
+def save_similar_products(ids, vectors, rows, k, min_score, batch_size=500):
+    """
+    The save_similar_products function replaces the k most similar
+    products of the products at the given rows, in a transaction per batch.
+
+    :param ids: The product id of every row of the vectors
+    :param vectors: A CSR matrix of unit vectors
+    :param rows: The positions of the products to update
+    :param k: The number of similar products kept per product
+    :param min_score: The smallest similarity that is kept
+    :param batch_size: The number of products per batch
+    :return: The number of products updated
+    """
+    rows = iter(rows)
+    count = 0
+    while batch := list(islice(rows, batch_size)):
+        similarities = get_similarities(vectors, batch, min_score)
+        similar_products = [
+            SimilarProduct(
+                product_id=ids[batch[i]], similar_id=ids[column], score=score
+            )
+            for i, top in iter_top(similarities, k)
+            for column, score in top
+        ]
+        with transaction.atomic():
+            SimilarProduct.objects.filter(
+                product_id__in=[ids[row] for row in batch]
+            ).delete()
+            SimilarProduct.objects.bulk_create(similar_products)
+        count += len(batch)
+    return count
+
+
+def rebuild_similar_products(k, min_score, batch_size=500):
+    """
+    The rebuild_similar_products function computes the similar products
+    of every product and caches the vectors for update_similar_products.
+
+    :param k: The number of similar products kept per product
+    :param min_score: The smallest similarity that is kept
+    :param batch_size: The number of products per batch
+    :return: The number of products updated
+    """
+    documents = get_documents()
+    ids = list(documents)
+    vocabulary = {}
+    counts = get_term_counts(list(documents.values()), vocabulary)
+    idf = get_idf(counts)
+    vectors = weigh(counts, idf)
+    cache.set(
+        MODEL_KEY,
+        {"ids": ids, "vocabulary": vocabulary, "idf": idf, "vectors": vectors},
+        None,
+    )
+    return save_similar_products(
+        ids, vectors, range(len(ids)), k, min_score, batch_size
+    )
+
+
+def update_vectors(model, product_id, document):
+    """
+    The update_vectors function replaces the vector of a product in the
+    cached model, or adds it. Only the document of the product is
+    vectorised, with the IDF weights of the last rebuild, a term that is
+    new gets the weight of a term of a single document.
+
+    :param model: The model cached by rebuild_similar_products
+    :param product_id: The id of the product
+    :param document: Its list of (text, weight) pairs, None if it was deleted
+    :return: The updated model
+    """
+    ids = model["ids"]
+    vectors = model["vectors"]
+    vocabulary = model["vocabulary"]
+    position = ids.index(product_id) if product_id in ids else None
+    if position is not None:
+        ids = ids[:position] + ids[position + 1 :]
+        vectors = sparse.vstack(
+            [vectors[:position], vectors[position + 1 :]], format="csr"
+        )
+    if document is not None:
+        counts = get_term_counts([document], vocabulary)
+        new_terms = len(vocabulary) - len(model["idf"])
+        idf = np.concatenate(
+            [model["idf"], np.full(new_terms, np.log((1 + len(ids)) / 2) + 1)]
+        )
+        vectors.resize((vectors.shape[0], len(vocabulary)))
+        vectors = sparse.vstack([vectors, weigh(counts, idf)], format="csr")
+        ids = ids + [product_id]
+        model["idf"] = idf
+    model["ids"] = ids
+    model["vectors"] = vectors
+    return model
+
+
+def update_similar_products(product_id, k, min_score):
+    """
+    The update_similar_products function refreshes the similar products
+    after the text of a product changed. Only the product is vectorised,
+    it is compared to the vectors cached by the last rebuild, whose IDF
+    weights are not updated until the next rebuild. Only the products
+    whose top k can change are updated: the product itself, the products
+    it was similar to and the products it is now more similar to than
+    their k-th similar product. Without cached vectors everything is
+    rebuilt.
+
+    :param product_id: The id of the product that changed
+    :param k: The number of similar products kept per product
+    :param min_score: The smallest similarity that is kept
+    :return: The number of products updated
+    """
+    if not cache.add(MODEL_LOCK_KEY, 1, MODEL_LOCK_TIMEOUT):
+        raise ModelLocked
+    try:
+        model = cache.get(MODEL_KEY)
+        if model is None:
+            return rebuild_similar_products(k, min_score)
+        document = get_documents([product_id]).get(product_id)
+        model = update_vectors(model, product_id, document)
+        cache.set(MODEL_KEY, model, None)
+    finally:
+        cache.delete(MODEL_LOCK_KEY)
+    if document is None:
+        # deleted products are removed from the table by the foreign keys
+        return 0
+    ids = model["ids"]
+    vectors = model["vectors"]
+    positions = {id: row for row, id in enumerate(ids)}
+    row = positions[product_id]
+    similarities = get_similarities(vectors, [row], min_score)
+    affected = {product_id}
+    affected.update(
+        SimilarProduct.objects.filter(similar_id=product_id).values_list(
+            "product_id", flat=True
+        )
+    )
+    tops = {
+        top["product_id"]: (top["count"], top["lowest"])
+        for top in SimilarProduct.objects.filter(
+            product_id__in=[ids[column] for column in similarities.indices]
+        )
+        .values("product_id")
+        .annotate(count=Count("id"), lowest=Min("score"))
+    }
+    for column, score in zip(similarities.indices, similarities.data):
+        count, lowest = tops.get(ids[column], (0, 0))
+        if count < k or score > lowest:
+            affected.add(ids[column])
+    return save_similar_products(
+        ids,
+        vectors,
+        sorted(positions[id] for id in affected if id in positions),
+        k,
+        min_score,
+    )
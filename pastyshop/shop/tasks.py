@@ -0,0 +1,106 @@
+import redis
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Product, recount_active_comments
+from .recommender import Recommender
+from .showcase import Showcase
+
+
+@shared_task(
+    autoretry_for=(redis.RedisError,), retry_backoff=True, max_retries=5
+)
+def products_bought(order_id):
+    """
+    Task to record the products of a paid order as bought together,
+    so they are recommended for each other. The order is recorded only
+    once, so it is retried when Redis fails.
+    """
+    products = Product.objects.filter(order_items__order_id=order_id).only(
+        "id"
+    )
+    return Recommender().products_bought(products, order_id=order_id)
+
+
+@shared_task
+def decay_purchases():
+    """
+    Periodic task to decay the co-purchase scores, when
+    RECOMMENDER_HALF_LIFE is set.
+    """
+    if not settings.RECOMMENDER_HALF_LIFE:
+        return 0
+    return Recommender().decay_purchases(
+        settings.RECOMMENDER_HALF_LIFE, settings.RECOMMENDER_MIN_SCORE
+    )
+
+
+@shared_task
+def trim_purchases():
+    """
+    Periodic task to keep only the RECOMMENDER_TOP_K best
+    co-purchase scores of every product.
+    """
+    return Recommender().trim_purchases(settings.RECOMMENDER_TOP_K)
+
+
+@shared_task
+def snapshot_recommendations():
+    """
+    Periodic task to copy the best co-purchases of every product
+    into Postgres, they are recommended while Redis is unavailable.
+    """
+    return Recommender().save_snapshot(settings.RECOMMENDER_SNAPSHOT_SIZE)
+
+
+@shared_task(bind=True, max_retries=5)
+def update_similar_products(self, product_id):
+    """
+    Task to refresh the similar products after the text or the category
+    of a product changed. It is retried while another worker updates
+    the cached vectors.
+    """
+    # scipy is only loaded by the workers
+    from .similarity import ModelLocked, update_similar_products
+
+    # the saves made from now on queue another update
+    cache.delete(f"similar_products:pending:{product_id}")
+    try:
+        return update_similar_products(
+            product_id,
+            settings.SIMILAR_PRODUCTS_TOP_K,
+            settings.SIMILAR_PRODUCTS_MIN_SCORE,
+        )
+    except ModelLocked as exc:
+        raise self.retry(exc=exc, countdown=5)
+
+
+@shared_task
+def rebuild_similar_products():
+    """
+    Periodic task to compute the similar products of every product
+    with up to date IDF weights.
+    """
+    from .similarity import rebuild_similar_products
+
+    return rebuild_similar_products(
+        settings.SIMILAR_PRODUCTS_TOP_K, settings.SIMILAR_PRODUCTS_MIN_SCORE
+    )
+
+
+@shared_task
+def build_bestsellers():
+    """
+    Periodic task to rank the bestsellers of every category.
+    """
+    return len(Showcase().build_bestsellers())
+
+
+@shared_task
+def recount_comments():
+    """
+    Periodic task to correct the active comment counts that drifted
+    from the comments.
+    """
+    return recount_active_comments()
@@ -0,0 +1,22 @@
+class QueryCountMixin:
+    """
+    TestCase mixin for pages whose number of queries must not grow with
+    the number of objects they show.
+    """
+
+    def assertPageQueries(self, num, url, data=None):
+        """
+        The assertPageQueries function requests a page and fails when it
+        does not take exactly num queries, e.g. a translation query per
+        product.
+
+        :param self: Represent the instance of the class
+        :param num: The expected number of queries
+        :param url: The url of the page
+        :param data: The GET parameters of the request
+        :return: The response
+        """
+        with self.assertNumQueries(num):
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return response
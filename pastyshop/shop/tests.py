@@ -1,3 +1,1414 @@
-from django.test import TestCase
+import inspect
+import io
+import os
+import time
+from collections import Counter
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models.functions import Upper
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import translation
+
+from ordersapp.models import Order, OrderItem
+
+from .admin import ProductAdmin
+from .checks import check_shared_cache
+from .circuitbreaker import CircuitBreaker
+from .copurchases import count_copurchases, iter_top
+from .models import (
+    Category,
+    Comment,
+    Product,
+    Recommendation,
+    SimilarProduct,
+)
+from .pagination import KeysetPaginator, RankedListPaginator, InvalidCursor
+from .purchases import get_purchase_storage
+from .purchases.base import get_weight
+from .purchases.memory import InMemoryPurchaseStorage
+from .purchases.redis import RedisPurchaseStorage
+from .purchases.sharded import HashRing, ShardedRedisPurchaseStorage
+from .recommender import Recommender, breaker, recommendations
+from .search import CachedSearchBackend, SearchResult, get_search_backend
+from .search.memory import InvertedIndex, InMemorySearchBackend
+from .search.postgres import PostgresSearchBackend
+from .showcase import Showcase
+from .similarity import (
+    get_documents,
+    get_vectors,
+    rebuild_similar_products,
+    update_similar_products,
+)
+from .tasks import products_bought, recount_comments
+from .tasks import update_similar_products as update_similar_products_task
+from .testing import QueryCountMixin
+
+
+class ShowcaseTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(
+            name="Vegetables", slug="vegetables"
+        )
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}",
+                slug=f"product-{i}",
+                price=10,
+                category=self.category,
+            )
+            for i in range(5)
+        ]
+        self.showcase = Showcase()
+
+    def test_pool_contains_available_products(self):
+        pool = self.showcase.get_pool("uk")
+        self.assertCountEqual(pool, [product.id for product in self.products])
+        self.assertEqual(self.showcase.get_pool("uk"), pool)
+
+    def test_unavailable_product_drops_out(self):
+        pool = self.showcase.get_pool("uk", self.category.id)
+        product = self.products[0]
+        product.available = False
+        product.save()
+
+        self.assertNotIn(product.id, self.showcase.get_pool("uk"))
+        self.assertNotIn(
+            product.id, self.showcase.get_pool("uk", self.category.id)
+        )
+        self.assertEqual(len(self.showcase.get_pool("uk")), len(pool) - 1)
+
+    def test_stale_pool_skips_unavailable_products(self):
+        pool = self.showcase.get_pool("uk")
+        product = self.products[0]
+        # taken off sale without the signals, the pool still holds it
+        Product.objects.filter(id=product.id).update(available=False)
+
+        self.assertIn(product.id, self.showcase.get_pool("uk"))
+        self.assertNotIn(product, self.showcase.get_products(pool))
+        self.assertEqual(len(self.showcase.get_products(pool)), len(pool) - 1)
+
+    def test_deleted_product_drops_out(self):
+        self.showcase.get_pool("uk")
+        product = self.products[0]
+        product_id = product.id
+        product.delete()
+
+        self.assertNotIn(product_id, self.showcase.get_pool("uk"))
+
+    def test_get_products_keeps_pool_order(self):
+        pool = self.showcase.get_pool("uk")
+        products = self.showcase.get_products(pool[:3])
+        self.assertEqual([product.id for product in products], pool[:3])
+
+    def sell(self, quantities, paid=True):
+        order = Order.objects.create(
+            first_name="Olena",
+            last_name="Shevchenko",
+            email="o@example.com",
+            address="Khreshchatyk 1",
+            postal_code="01001",
+            city="Kyiv",
+            paid=paid,
+        )
+        for product, quantity in quantities:
+            OrderItem.objects.create(
+                order=order, product=product, price=10, quantity=quantity
+            )
+
+    def test_bestsellers(self):
+        other = Product.objects.create(name="Other", slug="other", price=1)
+        self.sell([(self.products[1], 2), (other, 3)])
+        self.sell([(self.products[2], 1), (self.products[1], 2)])
+        self.sell([(self.products[3], 10)], paid=False)
+        with self.assertNumQueries(2):
+            bestsellers = self.showcase.build_bestsellers()
+        self.assertEqual(
+            bestsellers,
+            {
+                "bestsellers:all": [
+                    self.products[1].id,
+                    other.id,
+                    self.products[2].id,
+                ],
+                f"bestsellers:{self.category.id}": [
+                    self.products[1].id,
+                    self.products[2].id,
+                ],
+            },
+        )
+        self.products[1].available = False
+        self.products[1].save()
+        self.assertEqual(
+            self.showcase.get_bestsellers(), [other.id, self.products[2].id]
+        )
+
+    def test_sample_bestsellers(self):
+        self.sell([(self.products[1], 2), (self.products[2], 1)])
+        self.showcase.build_bestsellers()
+        with self.assertNumQueries(2):
+            products = self.showcase.sample_bestsellers(
+                "uk", 1, self.category.id, exclude=[self.products[1].id]
+            )
+        self.assertEqual(products, [self.products[2]])
+        # too few bestsellers, filled up from the shuffled pool
+        products = self.showcase.sample_bestsellers("uk", 4)
+        self.assertEqual(len(products), 4)
+        self.assertTrue(
+            {self.products[1], self.products[2]}.issubset(products)
+        )
+
+    def test_bestsellers_are_not_built_on_a_miss(self):
+        self.sell([(self.products[1], 2)])
+        self.showcase.get_pool("uk")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.showcase.get_bestsellers(), [])
+        # only the products, the pool stands in for the bestsellers
+        with self.assertNumQueries(2):
+            products = self.showcase.sample_bestsellers("uk", 2)
+        self.assertEqual(len(products), 2)
+
+
+class KeysetPaginatorTestCase(TestCase):
+    def setUp(self):
+        for i in range(7):
+            Product.objects.create(
+                name=f"Product {i}", slug=f"product-{i}", price=i % 3
+            )
+        self.queryset = Product.objects.filter(available=True)
+        self.ordering = ["-price", "-id"]
+        self.expected = list(self.queryset.order_by(*self.ordering))
+
+    def test_walk_forward_and_back(self):
+        paginator = KeysetPaginator(self.queryset, self.ordering, 3)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+
+        self.assertEqual(
+            [product for page in pages for product in page], self.expected
+        )
+        self.assertEqual(
+            [(page.start_index(), page.end_index()) for page in pages],
+            [(1, 3), (4, 6), (7, 7)],
+        )
+
+        previous = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(list(previous), list(pages[1]))
+        self.assertEqual(previous.start_index(), 4)
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(self.queryset, self.ordering, 3)
+        with self.assertRaises(InvalidCursor):
+            paginator.page("not-a-cursor")
+
+
+class RankedListPaginatorTestCase(TestCase):
+    def test_walk_forward_and_back(self):
+        results = [
+            SearchResult(id, rank)
+            for id, rank in [(9, 3.0), (4, 2.5), (8, 2.5), (2, 2.5), (5, 1.0)]
+        ]
+        results.sort(key=lambda result: (-result.rank, -result.id))
+        paginator = RankedListPaginator(results, ["-rank", "-id"], 2)
+
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(third), results)
+        self.assertFalse(third.has_next())
+        self.assertEqual(third.start_index(), 5)
+        self.assertEqual(
+            list(paginator.page(third.previous_cursor)), list(second)
+        )
+
+
+class InvertedIndexTestCase(TestCase):
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.index.add(1, [("Вареники з картоплею", 2), ("Домашні", 1)])
+        self.index.add(2, [("Вареники з вишнею", 2), ("Солодкі", 1)])
+        self.index.add(3, [("М'ясо свиняче", 2), ("", 1)])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(
+            [id for id, _ in self.index.search("вареники вишнею")], [2]
+        )
+        self.assertEqual(
+            {id for id, _ in self.index.search("вареники")}, {1, 2}
+        )
+        self.assertEqual(self.index.search("вареники борщ"), [])
+
+    def test_apostrophe_words(self):
+        self.assertEqual([id for id, _ in self.index.search("м’ясо")], [3])
+
+    def test_remove_and_update(self):
+        self.index.remove(2)
+        self.assertEqual([id for id, _ in self.index.search("вареники")], [1])
+        self.index.add(1, [("Пельмені", 2)])
+        self.assertEqual(self.index.search("вареники"), [])
+        self.assertEqual(self.index.complete("пел"), {1})
+        self.assertEqual(len(self.index), 2)
+
+
+@override_settings(SEARCH_BACKEND="shop.search.memory.InMemorySearchBackend")
+class InMemorySearchBackendTestCase(TestCase):
+    def setUp(self):
+        get_search_backend.cache_clear()
+        self.addCleanup(get_search_backend.cache_clear)
+        self.product = Product.objects.create(
+            name="Вареники з вишнею",
+            slug="vareniki",
+            description="Домашні вареники",
+            price=10,
+        )
+        Product.objects.create(
+            name="Пельмені", slug="pelmeni", description="", price=12
+        )
+
+    @mock.patch("shop.views.Recommender.suggest_products_for")
+    def test_search_view(self, suggest_products_for):
+        suggest_products_for.return_value = []
+        response = self.client.get(
+            reverse("shop:products_search"), {"query": "вареники"}
+        )
+        self.assertEqual(
+            [product.id for product in response.context["results"]],
+            [self.product.id],
+        )
+
+    def test_index_follows_product_signals(self):
+        backend = get_search_backend()
+        self.assertIsInstance(backend, CachedSearchBackend)
+        self.assertIsInstance(backend.backend, InMemorySearchBackend)
+        self.assertEqual(len(backend.search("вареники", "uk")), 1)
+
+        self.product.available = False
+        self.product.save()
+        self.assertEqual(backend.search("вареники", "uk"), [])
+
+        self.product.available = True
+        self.product.name = "Вареники з сиром"
+        self.product.save()
+        self.assertEqual(backend.search("вишнею", "uk"), [])
+        self.assertEqual(len(backend.search("сиром", "uk")), 1)
+
+    def test_suggest(self):
+        response = self.client.get(
+            reverse("shop:products_suggest"), {"query": "пел"}
+        )
+        self.assertEqual(
+            response.json()["products"],
+            [
+                {
+                    "name": "Пельмені",
+                    "url": Product.objects.get(
+                        translations__slug="pelmeni"
+                    ).get_absolute_url(),
+                }
+            ],
+        )
+        self.assertEqual(response.json()["categories"], [])
+        # a single letter matches too much to be worth a query
+        response = self.client.get(
+            reverse("shop:products_suggest"), {"query": "п"}
+        )
+        self.assertEqual(response.json(), {"products": [], "categories": []})
+
+    @override_settings(SEARCH_TOP_RESULTS=2)
+    @mock.patch("shop.views.Recommender.suggest_products_for", return_value=[])
+    def test_top_mode(self, suggest_products_for):
+        for i in range(3):
+            Product.objects.create(
+                name=f"Вареники {i}", slug=f"vareniki-{i}", price=i
+            )
+        url = reverse("shop:products_search")
+        response = self.client.get(url, {"query": "вареники", "top": "1"})
+        self.assertEqual(len(response.context["results"]), 2)
+        self.assertNotContains(response, "cursor=")
+        self.assertContains(response, "All results")
+        response = self.client.get(url, {"query": "вареники"})
+        self.assertEqual(response.context["results"].paginator.count, 4)
+
+    @mock.patch("shop.views.Recommender.suggest_products_for", return_value=[])
+    def test_header_search_box(self, suggest_products_for):
+        response = self.client.get(reverse("shop:product_list"))
+        self.assertContains(response, '<input type="hidden" name="top"')
+        self.assertContains(response, reverse("shop:products_suggest"))
+
+
+@skipUnless(
+    connection.vendor == "postgresql",
+    "the search vectors and the trigram indexes need Postgres",
+)
+class PostgresSearchBackendTestCase(TestCase):
+    def setUp(self):
+        self.backend = PostgresSearchBackend()
+        self.dumplings = Product.objects.create(
+            name="Dumplings", slug="dumplings", description="", price=10
+        )
+        self.pelmeni = Product.objects.create(
+            name="Pelmeni",
+            slug="pelmeni",
+            description="Siberian dumplings",
+            price=12,
+        )
+
+    def assertUsesIndex(self, queryset, name):
+        with connection.cursor() as cursor:
+            # the tables are too small for the planner to pick an index
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn(name, queryset.explain())
+
+    def test_search_ranks_names_first(self):
+        self.assertEqual(
+            [result.id for result in self.backend.search("dumplings", "uk")],
+            [self.dumplings.id, self.pelmeni.id],
+        )
+        self.assertEqual(self.backend.search("borscht", "uk"), [])
+
+    def test_search_vector_follows_the_name(self):
+        self.dumplings.name = "Varenyky"
+        self.dumplings.save()
+        self.assertEqual(
+            [result.id for result in self.backend.search("varenyky", "uk")],
+            [self.dumplings.id],
+        )
+
+    def test_search_uses_the_gin_index(self):
+        self.assertUsesIndex(
+            self.backend.get_queryset("dumplings", "uk"),
+            "shop_product_search_gin",
+        )
+
+    def test_suggest_misspelled_names(self):
+        suggestions = self.backend.suggest("dumplngs", "uk", 5)
+        self.assertEqual(
+            [product["name"] for product in suggestions["products"]],
+            ["Dumplings"],
+        )
+        suggestions = self.backend.suggest("pel", "uk", 5)
+        self.assertEqual(
+            [product["name"] for product in suggestions["products"]],
+            ["Pelmeni"],
+        )
+
+    def test_suggest_uses_the_trigram_index(self):
+        ProductTranslation = Product._parler_meta.root_model
+        self.assertUsesIndex(
+            ProductTranslation.objects.annotate(
+                upper_name=Upper("name")
+            ).filter(upper_name__trigram_similar="DUMPLNGS"),
+            "shop_product_name_trgm",
+        )
+
+    def test_listings_use_the_keyset_indexes(self):
+        self.assertUsesIndex(
+            Product.objects.filter(available=True).order_by("price", "id"),
+            "shop_produc_availab",
+        )
+        self.assertUsesIndex(
+            Product.objects.filter(category_id=1, available=True).order_by(
+                "price", "id"
+            ),
+            "shop_produc_categor",
+        )
+
+
+@override_settings(SEARCH_BACKEND="shop.search.memory.InMemorySearchBackend")
+class CachedSearchBackendTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_search_backend.cache_clear()
+        self.addCleanup(get_search_backend.cache_clear)
+        self.product = Product.objects.create(
+            name="Вареники з вишнею", slug="vareniki", description="", price=10
+        )
+        self.backend = get_search_backend()
+
+    def test_normalized_queries_share_an_entry(self):
+        results = self.backend.search("Вареники  ", "uk")
+        with mock.patch.object(self.backend.backend, "search") as search:
+            self.assertEqual(self.backend.search("вареники", "uk"), results)
+            self.assertEqual(
+                self.backend.search("вишнею вареники", "uk"),
+                search.return_value,
+            )
+        search.assert_called_once_with("вишнею вареники", "uk")
+        self.assertEqual(self.backend.search("  ", "uk"), [])
+
+    def test_normalize_without_queries(self):
+        # the cache key is computed before the cache is read
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                PostgresSearchBackend().normalize("Вареники  З вишнею", "uk"),
+                "вареники вишнею з",
+            )
+
+    def test_product_change_invalidates(self):
+        self.assertEqual(len(self.backend.search("вареники", "uk")), 1)
+        Product.objects.create(
+            name="Вареники з сиром", slug="vareniki-2", description="", price=9
+        )
+        self.assertEqual(len(self.backend.search("вареники", "uk")), 2)
+        self.product.delete()
+        self.assertEqual(len(self.backend.search("вареники", "uk")), 1)
+
+    @mock.patch("shop.signals.update_similar_products.apply_async")
+    def test_translation_change_invalidates(self, apply_async):
+        self.assertEqual(self.backend.search("сиром", "uk"), [])
+        translation = self.product.get_translation("uk")
+        translation.name = "Вареники з сиром"
+        generation = self.backend.get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            translation.save()
+            # the index is refreshed once the translation is committed
+            self.assertEqual(self.backend.get_generation(), generation)
+        self.assertEqual(len(self.backend.search("сиром", "uk")), 1)
+
+    def test_local_cache_is_reported(self):
+        locmem = "django.core.cache.backends.locmem.LocMemCache"
+        redis_cache = "django.core.cache.backends.redis.RedisCache"
+        with override_settings(CACHES={"default": {"BACKEND": locmem}}):
+            self.assertEqual(
+                [error.id for error in check_shared_cache(None)],
+                ["shop.W001"],
+            )
+        with override_settings(CACHES={"default": {"BACKEND": redis_cache}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_miss_is_computed_once(self):
+        key = self.backend.get_results_key("вареники", "uk")
+        cache.add(f"{key}:lock", 1)
+        # another worker is ranking the query and stores its results
+        cache.set(key, [(self.product.id, 1.0)])
+        with mock.patch.object(self.backend.backend, "search") as search:
+            self.assertEqual(
+                self.backend.search("вареники", "uk"),
+                [SearchResult(self.product.id, 1.0)],
+            )
+        search.assert_not_called()
+
+    @override_settings(SEARCH_CACHE_LOCK_TIMEOUT=0)
+    def test_lock_is_kept_after_waiting(self):
+        key = self.backend.get_results_key("вареники", "uk")
+        cache.add(f"{key}:lock", 1)
+        # the results didn't come in time, the query is ranked here
+        self.assertEqual(len(self.backend.search("вареники", "uk")), 1)
+        self.assertEqual(cache.get(f"{key}:lock"), 1)
+
+
+@override_settings(SEARCH_BACKEND="shop.search.memory.InMemorySearchBackend")
+@mock.patch("shop.views.Recommender.suggest_products_for", return_value=[])
+class PageQueriesTestCase(QueryCountMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        get_search_backend.cache_clear()
+        self.addCleanup(get_search_backend.cache_clear)
+        # requests to English urls leave English active in this thread
+        self.addCleanup(translation.deactivate)
+        self.category = Category.objects.create(
+            name="Вареники", slug="vareniki"
+        )
+        self.category.set_current_language("en")
+        self.category.name = "Dumplings"
+        self.category.slug = "dumplings"
+        self.category.save()
+        for i in range(12):
+            product = Product.objects.create(
+                category=self.category,
+                name=f"Вареники {i}",
+                slug=f"vareniki-{i}",
+                price=10 + i,
+            )
+            # every other product falls back to its Ukrainian name
+            if i % 2:
+                product.set_current_language("en")
+                product.name = f"Dumplings {i}"
+                product.slug = f"dumplings-{i}"
+                product.save()
+        cache.clear()
+
+    def test_product_list(self, suggest_products_for):
+        url = reverse("shop:product_list")
+        self.assertPageQueries(5, url)
+        self.assertPageQueries(4, url, {"orderby": "price"})
+        with translation.override("en"):
+            url = reverse("shop:product_list_by_category", args=["dumplings"])
+        self.assertPageQueries(7, url)
+
+    def test_keyset_count_matches_the_pages(self, suggest_products_for):
+        with translation.override("en"):
+            url = reverse("shop:product_list")
+        response = self.client.get(url, {"orderby": "price"})
+        products = list(response.context["products"])
+        while response.context["products"].next_cursor:
+            response = self.client.get(
+                url,
+                {
+                    "orderby": "price",
+                    "cursor": response.context["products"].next_cursor,
+                },
+            )
+            products += response.context["products"]
+        # only the products translated to English are paged and counted
+        self.assertEqual(response.context["total_products_count"], 6)
+        self.assertEqual(len(products), 6)
+
+    def test_products_search(self, suggest_products_for):
+        get_search_backend().search("вареники", "uk")
+        # the bestsellers are ranked by a periodic task
+        Showcase().build_bestsellers()
+        Showcase().get_pool("uk")
+        self.assertPageQueries(
+            4, reverse("shop:products_search"), {"query": "вареники"}
+        )
+
+    def test_main_page(self, suggest_products_for):
+        with translation.override("en"):
+            url = reverse("main:main_page")
+        self.assertPageQueries(3, url)
+
+    @mock.patch("cart.views.Recommender.suggest_products_for", return_value=[])
+    def test_cart_detail(
+        self, cart_suggest_products_for, suggest_products_for
+    ):
+        for product in Product.objects.all()[:5]:
+            self.client.post(
+                reverse("cart:cart_add", args=[product.id]),
+                {"quantity": 1, "override": False},
+            )
+        Showcase().build_bestsellers()
+        Showcase().get_pool("uk")
+        # the session, the cart products once for the view, the templates
+        # and the context processor, and a sample of bestsellers as there
+        # is nothing to recommend
+        self.assertPageQueries(5, reverse("cart:cart_detail"))
+
+
+@mock.patch("shop.views.Recommender.suggest_products_for", return_value=[])
+class CommentTestCase(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name="Вареники", slug="vareniki", price=10
+        )
+        self.url = self.product.get_absolute_url()
+
+    def add_comment(self, **kwargs):
+        return Comment.objects.create(
+            product=self.product, name="Olena", email="o@example.com", **kwargs
+        )
+
+    def get_count(self):
+        self.product.refresh_from_db()
+        return self.product.active_comment_count
+
+    def test_active_comment_count(self, suggest_products_for):
+        comment = self.add_comment(body="Смачно")
+        self.add_comment(body="Spam", active=False)
+        self.assertEqual(self.get_count(), 1)
+
+        comment.active = False
+        comment.save()
+        self.assertEqual(self.get_count(), 0)
+        comment.active = True
+        comment.save()
+        comment.save()
+        self.assertEqual(self.get_count(), 1)
+
+        # saving a stale product in the admin doesn't overwrite the counter
+        stale = Product.objects.get(id=self.product.id)
+        self.add_comment(body="Ще")
+        stale.price = 11
+        ProductAdmin(Product, admin.site).save_model(None, stale, None, True)
+        self.assertEqual(self.get_count(), 2)
+        self.assertEqual(self.product.price, 11)
+
+        comment.delete()
+        self.assertEqual(self.get_count(), 1)
+
+    def test_recount_comments(self, suggest_products_for):
+        comments = [self.add_comment(body=str(i)) for i in range(3)]
+        other = Product.objects.create(name="Борщ", slug="borshch", price=5)
+        # a queryset update bypasses the signals
+        Comment.objects.filter(id=comments[0].id).update(active=False)
+        self.assertEqual(self.get_count(), 3)
+
+        out = io.StringIO()
+        call_command("recount_comments", stdout=out)
+        self.assertEqual(
+            out.getvalue(), "Corrected the count of 1 products.\n"
+        )
+        self.assertEqual(self.get_count(), 2)
+        other.refresh_from_db()
+        self.assertEqual(other.active_comment_count, 0)
+        self.assertEqual(recount_comments(), 0)
+
+    def test_post_comment(self, suggest_products_for):
+        response = self.client.post(
+            self.url,
+            {"name": "Olena", "email": "o@example.com", "body": "Смачно"},
+        )
+        self.assertEqual(response.context["total_comments_count"], 1)
+
+    def test_comment_pages(self, suggest_products_for):
+        comments = [self.add_comment(body=str(i)) for i in range(7)]
+        self.add_comment(body="Spam", active=False)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["total_comments_count"], 7)
+        page = response.context["comments"]
+        self.assertEqual(list(page), comments[:3])
+
+        response = self.client.get(self.url, {"cursor": page.next_cursor})
+        page = response.context["comments"]
+        self.assertEqual(list(page), comments[3:6])
+
+        response = self.client.get(self.url, {"cursor": page.previous_cursor})
+        self.assertEqual(list(response.context["comments"]), comments[:3])
+
+
+MEMORY_STORAGE = "shop.purchases.memory.InMemoryPurchaseStorage"
+
+
+class PurchaseStorageTestMixin:
+    """
+    The behaviour every co-purchase storage must have,
+    the test case sets self.storage.
+    """
+
+    def test_record(self):
+        self.assertTrue(self.storage.record([1, 2, 3]))
+        self.assertTrue(self.storage.record([1, 2]))
+        self.assertEqual(self.storage.get_scores(1), [(2, 2), (3, 1)])
+        self.assertEqual(self.storage.get_scores(3), [(2, 1), (1, 1)])
+        self.assertEqual(self.storage.get_scores(4), [])
+
+    @override_settings(RECOMMENDER_TOP_K=1)
+    def test_record_keeps_the_top(self):
+        # twice RECOMMENDER_TOP_K scores are kept when recording
+        self.storage.record([1, 2])
+        self.storage.record([1, 2, 3, 4])
+        self.assertEqual(self.storage.get_scores(1), [(2, 2), (4, 1)])
+
+    @override_settings(RECOMMENDER_TOP_K=1)
+    def test_new_pairs_can_rise(self):
+        self.storage.record([1, 2])
+        self.storage.record([1, 2])
+        self.storage.trim(1)
+        # a new pair is not trimmed as soon as it is recorded
+        self.storage.record([1, 3])
+        self.storage.record([1, 3])
+        self.storage.record([1, 3])
+        self.storage.trim(1)
+        self.assertEqual(self.storage.get_scores(1), [(3, 3)])
+
+    def test_order_is_recorded_once(self):
+        self.assertTrue(self.storage.record([1, 2], order_id=7))
+        self.assertFalse(self.storage.record([1, 2], order_id=7))
+        self.assertEqual(self.storage.get_scores(1), [(2, 1)])
+
+    def test_versions(self):
+        versions = self.storage.get_versions([1, 2])
+        self.storage.record([2, 3])
+        changed = self.storage.get_versions([1, 2])
+        self.assertEqual(changed[0], versions[0])
+        self.assertNotEqual(changed[1], versions[1])
+
+    def test_top(self):
+        self.storage.load(
+            [
+                (1, [(2, 1), (3, 5), (4, 2)]),
+                (2, [(1, 1), (4, 2), (5, 1)]),
+            ]
+        )
+        self.assertEqual(self.storage.get_top([1], 2), [3, 4])
+        self.assertEqual(self.storage.get_top([1, 2], 3), [3, 4, 5])
+        self.assertEqual(self.storage.get_top([6], 3), [])
+
+    def test_load_replaces_scores(self):
+        self.storage.record([1, 2])
+        versions = self.storage.get_versions([1, 2])
+        self.assertEqual(self.storage.load([(1, [(3, 2.5)]), (2, None)]), 2)
+        self.assertEqual(self.storage.get_scores(1), [(3, 2.5)])
+        self.assertEqual(self.storage.get_scores(2), [])
+        self.assertNotEqual(self.storage.get_versions([1, 2]), versions)
+
+    def test_decay(self):
+        self.storage.load([(1, [(2, 4), (3, 1)])])
+        self.assertEqual(self.storage.decay(60, 0.6), 0)
+        self.storage.set_decayed_at(time.time() - 60)
+        versions = self.storage.get_versions([1])
+        self.assertEqual(self.storage.decay(60, 0.6), 1)
+        self.assertNotEqual(self.storage.get_versions([1]), versions)
+        [(with_id, score)] = self.storage.get_scores(1)
+        self.assertEqual(with_id, 2)
+        self.assertAlmostEqual(score, 2, places=2)
+
+    def test_trim(self):
+        self.storage.load([(1, [(2, 3), (3, 2), (4, 1)]), (2, [(1, 3)])])
+        versions = self.storage.get_versions([1])
+        self.assertEqual(self.storage.trim(1), 2)
+        self.assertNotEqual(self.storage.get_versions([1]), versions)
+        self.assertEqual(self.storage.get_scores(1), [(2, 3)])
+        self.assertEqual(self.storage.get_scores(2), [(1, 3)])
+
+    def test_sizes(self):
+        self.storage.load([(1, [(2, 3), (3, 2)]), (2, [(1, 3)])])
+        sizes = sorted(self.storage.iter_sizes(batch_size=1))
+        self.assertEqual(
+            [(name, members) for name, members, _ in sizes],
+            [("product:1:purchased_with", 2), ("product:2:purchased_with", 1)],
+        )
+
+    def test_clear(self):
+        self.storage.load([(i, [(i + 1, 1)]) for i in range(1, 6)])
+        progress = mock.Mock()
+        self.assertEqual(
+            self.storage.clear([1, 2, 9], batch_size=2, progress=progress),
+            2,
+        )
+        self.assertEqual(progress.call_args_list, [mock.call(2), mock.call(3)])
+        self.assertEqual(self.storage.get_scores(1), [])
+        self.assertEqual(self.storage.get_scores(3), [(4, 1)])
+        self.assertEqual(self.storage.clear(batch_size=2), 3)
+        self.assertEqual(self.storage.get_scores(3), [])
+
+    def test_clear_keeps_the_versions(self):
+        self.storage.record([1, 2])
+        versions = self.storage.get_versions([1])
+        self.storage.clear([1])
+        self.storage.record([1, 3])
+        # recommendations cached before the clear are stale
+        self.assertNotEqual(self.storage.get_versions([1]), versions)
+
+
+class InMemoryPurchaseStorageTestCase(PurchaseStorageTestMixin, TestCase):
+    def setUp(self):
+        self.storage = InMemoryPurchaseStorage()
+
+
+@skipUnless(
+    os.environ.get("REDIS_TEST_URL"),
+    "REDIS_TEST_URL is not set, the Redis database is flushed",
+)
+class RedisPurchaseStorageTestCase(PurchaseStorageTestMixin, TestCase):
+    def setUp(self):
+        client = redis.Redis.from_url(os.environ["REDIS_TEST_URL"])
+        client.flushdb()
+        self.addCleanup(client.flushdb)
+        self.storage = RedisPurchaseStorage(client)
+
+
+class HashRingTestCase(TestCase):
+    def test_spread(self):
+        ring = HashRing(["a", "b", "c"])
+        nodes = Counter(ring.get_node(str(id)) for id in range(3000))
+        self.assertEqual(set(nodes), {"a", "b", "c"})
+        self.assertTrue(all(count > 700 for count in nodes.values()))
+
+    def test_adding_a_node_moves_only_its_keys(self):
+        ring = HashRing(["a", "b", "c"])
+        new_ring = HashRing(["a", "b", "c", "d"])
+        moved = [
+            id
+            for id in range(3000)
+            if ring.get_node(str(id)) != new_ring.get_node(str(id))
+        ]
+        self.assertTrue(500 < len(moved) < 1000)
+        self.assertTrue(all(new_ring.get_node(str(id)) == "d" for id in moved))
+
+
+def get_test_nodes():
+    return os.environ.get("REDIS_TEST_NODES", "").split()
+
+
+@skipUnless(
+    get_test_nodes(),
+    "REDIS_TEST_NODES is not set, the Redis databases are flushed",
+)
+class ShardedRedisPurchaseStorageTestCase(PurchaseStorageTestMixin, TestCase):
+    def setUp(self):
+        self.nodes = get_test_nodes()
+        for node in self.nodes:
+            client = redis.Redis.from_url(node)
+            client.flushdb()
+            self.addCleanup(client.flushdb)
+        self.storage = ShardedRedisPurchaseStorage(self.nodes[:-1])
+
+    def test_rebalance(self):
+        self.storage.load([(id, [(id + 1, id)]) for id in range(1, 101)])
+        storage = ShardedRedisPurchaseStorage(self.nodes)
+        storage.record([1, 2])
+        moved = storage.rebalance()
+        self.assertEqual(
+            moved,
+            sum(
+                storage.ring.get_node(str(id)) == self.nodes[-1]
+                for id in range(1, 101)
+            ),
+        )
+        self.assertEqual(storage.rebalance(), 0)
+        self.assertEqual(storage.get_scores(1), [(2, 2)])
+        for id in range(2, 101):
+            self.assertEqual(storage.get_scores(id)[0], (id + 1, id))
+
+    def test_retry_after_a_shard_failed(self):
+        products_ids = list(range(1, 11))
+        groups = self.storage.group(products_ids)
+        self.assertGreater(len(groups), 1)
+        failing = next(iter(groups))
+        with mock.patch.object(
+            failing, "increment", side_effect=redis.ConnectionError
+        ), self.assertRaises(redis.ConnectionError):
+            self.storage.record(products_ids, order_id=7)
+        self.assertTrue(self.storage.record(products_ids, order_id=7))
+        self.assertFalse(self.storage.record(products_ids, order_id=7))
+        # every pair was counted once, on the shards that failed or not
+        for id in products_ids:
+            scores = self.storage.get_scores(id)
+            self.assertEqual(len(scores), 9)
+            self.assertEqual({score for _, score in scores}, {1})
+
+    def test_ties_are_broken_alike(self):
+        self.storage.load([(1, [(9, 1), (10, 1)]), (2, [])])
+        # numeric ids, Redis alone would put "9" before "10"
+        self.assertEqual(self.storage.get_top([1], 1), [10])
+        self.assertEqual(self.storage.get_top([1, 2], 1), [10])
+
+    def test_move(self):
+        source, target = list(self.storage.shards.values())[:2]
+        source.load([(1, [(2, 3)]), (2, [(1, 3)])])
+        target.load([(1, [(2, 1), (3, 1)])])
+        # product 3 has no scores any more
+        self.assertEqual(self.storage.move(source, target, ["1", "2", "3"]), 2)
+        self.assertEqual(target.get_scores(1), [(2, 4), (3, 1)])
+        self.assertEqual(target.get_scores(2), [(1, 3)])
+        self.assertEqual(source.get_scores(1), [])
+
+    def test_move_puts_back_on_failure(self):
+        source, target = list(self.storage.shards.values())[:2]
+        source.load([(1, [(2, 3)])])
+        with mock.patch.object(
+            target.r, "pipeline", side_effect=redis.ConnectionError
+        ), self.assertRaises(redis.ConnectionError):
+            self.storage.move(source, target, ["1"])
+        self.assertEqual(source.get_scores(1), [(2, 3)])
+
+    def test_remove_a_node(self):
+        self.storage.load([(id, [(id + 1, id)]) for id in range(1, 101)])
+        storage = ShardedRedisPurchaseStorage(self.nodes[1:-1])
+        storage.rebalance([self.nodes[0]])
+        for id in range(1, 101):
+            self.assertEqual(storage.get_scores(id), [(id + 1, id)])
+
+
+class RebalanceRecommendationsTestCase(TestCase):
+    @override_settings(RECOMMENDER_STORAGE=MEMORY_STORAGE)
+    def test_not_sharded(self):
+        get_purchase_storage.cache_clear()
+        self.addCleanup(get_purchase_storage.cache_clear)
+        with self.assertRaises(CommandError):
+            call_command("rebalance_recommendations")
+
+
+@override_settings(RECOMMENDER_STORAGE=MEMORY_STORAGE)
+class ProductsBoughtTestCase(TestCase):
+    def setUp(self):
+        get_purchase_storage.cache_clear()
+        self.addCleanup(get_purchase_storage.cache_clear)
+
+    def test_order_is_recorded_once(self):
+        order = Order.objects.create(
+            first_name="Olena",
+            last_name="Shevchenko",
+            email="o@example.com",
+            address="Khreshchatyk 1",
+            postal_code="01001",
+            city="Kyiv",
+        )
+        products = [
+            Product.objects.create(name=f"Product {i}", slug=f"p-{i}", price=1)
+            for i in range(3)
+        ]
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, price=1)
+
+        self.assertTrue(products_bought(order.id))
+        self.assertFalse(products_bought(order.id))
+        storage = get_purchase_storage()
+        self.assertCountEqual(
+            storage.get_scores(products[0].id),
+            [(products[1].id, 1), (products[2].id, 1)],
+        )
+
+
+@override_settings(RECOMMENDER_STORAGE=MEMORY_STORAGE)
+class SuggestProductsTestCase(TestCase):
+    def setUp(self):
+        get_purchase_storage.cache_clear()
+        self.addCleanup(get_purchase_storage.cache_clear)
+        self.products = [
+            Product.objects.create(name=f"Product {i}", slug=f"p-{i}", price=1)
+            for i in range(4)
+        ]
+        self.products[2].available = False
+        self.products[2].save()
+        recommendations.clear()
+        self.addCleanup(recommendations.clear)
+
+    def test_reads_only_the_top(self):
+        storage = get_purchase_storage()
+        storage.load(
+            [
+                (
+                    self.products[0].id,
+                    [(product.id, product.id) for product in self.products],
+                )
+            ]
+        )
+        with mock.patch.object(
+            storage, "get_top", wraps=storage.get_top
+        ) as get_top:
+            suggestions = Recommender().suggest_products_for(
+                [self.products[0]], 2
+            )
+        self.assertEqual(suggestions, [self.products[3], self.products[1]])
+        get_top.assert_called_once_with([self.products[0].id], 6)
+
+    def test_cached_until_scores_change(self):
+        recommender = Recommender()
+        recommender.products_bought([self.products[0], self.products[3]])
+        for i in range(3):
+            suggestions = recommender.suggest_products_for(
+                self.products[1::-1], 4
+            )
+        self.assertEqual(suggestions, [self.products[3]])
+        self.assertEqual(recommendations.info()["hits"], 2)
+        self.assertEqual(recommendations.info()["misses"], 1)
+
+        # products_bought bumped the version of one of the products
+        recommender.products_bought([self.products[1], self.products[2]])
+        suggestions = recommender.suggest_products_for(self.products[:2], 4)
+        self.assertEqual(suggestions, [self.products[3]])
+        self.assertEqual(recommendations.info()["misses"], 2)
+
+
+class CircuitBreakerTestCase(TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker("test", 2, 30, errors=ConnectionError)
+        self.function = mock.Mock(side_effect=ConnectionError)
+        self.fallback = mock.Mock(return_value="fallback")
+
+    def test_opens_after_failures(self):
+        with self.assertLogs("shop.circuitbreaker", "WARNING"):
+            for i in range(3):
+                self.assertEqual(
+                    self.breaker.call(self.function, self.fallback, 1),
+                    "fallback",
+                )
+        self.assertEqual(self.function.call_count, 2)
+        self.fallback.assert_called_with(1)
+        self.assertEqual(
+            self.breaker.info(),
+            {
+                "state": "open",
+                "calls": 3,
+                "failures": 2,
+                "fallbacks": 3,
+                "opened": 1,
+            },
+        )
+
+    def test_closes_after_a_successful_trial(self):
+        with self.assertLogs("shop.circuitbreaker", "WARNING"):
+            for i in range(2):
+                self.breaker.call(self.function, self.fallback)
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 31):
+            self.assertTrue(self.breaker.allow())
+            # only one trial call at a time
+            self.assertFalse(self.breaker.allow())
+            self.breaker.record_failure()
+            self.assertEqual(self.breaker.info()["state"], "open")
+        monotonic = time.monotonic() + 62
+        with mock.patch(
+            "time.monotonic", return_value=monotonic
+        ), self.assertLogs("shop.circuitbreaker", "INFO"):
+            self.function.side_effect = None
+            self.function.return_value = "result"
+            self.assertEqual(
+                self.breaker.call(self.function, self.fallback), "result"
+            )
+        self.assertEqual(self.breaker.info()["state"], "closed")
+
+    def test_other_errors_are_raised(self):
+        self.function.side_effect = ValueError
+        with self.assertRaises(ValueError):
+            self.breaker.call(self.function, self.fallback)
+        self.fallback.assert_not_called()
+
+
+@override_settings(RECOMMENDER_STORAGE=MEMORY_STORAGE)
+class RecommendationSnapshotTestCase(TestCase):
+    def setUp(self):
+        get_purchase_storage.cache_clear()
+        self.addCleanup(get_purchase_storage.cache_clear)
+        recommendations.clear()
+        self.addCleanup(recommendations.clear)
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+        self.products = [
+            Product.objects.create(name=f"Product {i}", slug=f"p-{i}", price=1)
+            for i in range(5)
+        ]
+        self.products[4].available = False
+        self.products[4].save()
+        recommender = Recommender()
+        recommender.products_bought(self.products[:2])
+        recommender.products_bought(self.products[:3])
+        recommender.products_bought([self.products[0], self.products[4]])
+        recommender.products_bought([self.products[3], self.products[2]])
+        recommender.load_purchases([(self.products[3].id, None)])
+
+    def test_save_snapshot(self):
+        Recommendation.objects.create(
+            product=self.products[3], recommended=self.products[1], score=1
+        )
+        self.assertEqual(Recommender().save_snapshot(2, batch_size=2), 4)
+        rows = Recommendation.objects.values_list(
+            "product", "recommended", "score"
+        )
+        self.assertCountEqual(
+            rows,
+            [
+                (self.products[0].id, self.products[1].id, 2),
+                (self.products[0].id, self.products[4].id, 1),
+                (self.products[1].id, self.products[0].id, 2),
+                (self.products[1].id, self.products[2].id, 1),
+                (self.products[2].id, self.products[3].id, 1),
+                (self.products[2].id, self.products[1].id, 1),
+                (self.products[4].id, self.products[0].id, 1),
+            ],
+        )
+
+    def test_fall_back_to_the_snapshot(self):
+        recommender = Recommender()
+        recommender.save_snapshot(10)
+        recommender.products_bought([self.products[1], self.products[3]])
+        with mock.patch.object(
+            recommender.storage,
+            "get_versions",
+            side_effect=redis.ConnectionError,
+        ):
+            # the snapshot, its translations and the similar products
+            with self.assertNumQueries(3), self.assertLogs(
+                "shop.circuitbreaker", "WARNING"
+            ):
+                suggestions = recommender.suggest_products_for(
+                    self.products[:2], 4
+                )
+        # the scores of the products are summed, unavailable ones skipped
+        self.assertEqual(suggestions, [self.products[2]])
+        self.assertEqual(breaker.info()["fallbacks"], 1)
+        self.assertEqual(
+            recommender.suggest_products_for(self.products[:2], 4),
+            [self.products[2], self.products[3]],
+        )
+
+    def test_other_errors_are_raised(self):
+        recommender = Recommender()
+        recommender.save_snapshot(10)
+        with mock.patch.object(
+            recommender.storage, "get_versions", side_effect=TypeError
+        ), self.assertRaises(TypeError):
+            recommender.suggest_products_for(self.products[:2], 4)
+        self.assertEqual(breaker.info()["fallbacks"], 0)
+
+    def test_metrics(self):
+        url = reverse("shop:recommender_metrics")
+        self.assertEqual(self.client.get(url).status_code, 302)
+        user = get_user_model().objects.create_user(
+            email="staff@example.com",
+            password="secret",
+            first_name="Olena",
+            last_name="Shevchenko",
+            is_staff=True,
+        )
+        self.client.force_login(user)
+        response = self.client.get(url)
+        self.assertEqual(response.json()["breaker"]["state"], "closed")
+        self.assertIn("hits", response.json()["cache"])
+
+
+class SimilarProductsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.category = Category.objects.create(name="Чай", slug="chai")
+        names = [
+            ("Зелений чай", "Китайський зелений чай"),
+            ("Зелений чай з жасмином", "Зелений чай"),
+            ("Чорний чай", "Цейлонський чорний чай"),
+            ("Вареники картопляні", "Домашні вареники"),
+        ]
+        self.products = [
+            Product.objects.create(
+                name=name,
+                slug=f"p-{i}",
+                description=description,
+                price=1,
+                category=self.category if i < 3 else None,
+            )
+            for i, (name, description) in enumerate(names)
+        ]
+
+    def get_similar(self, product):
+        return list(
+            SimilarProduct.objects.filter(product=product)
+            .order_by("-score")
+            .values_list("similar", flat=True)
+        )
+
+    def test_vectors(self):
+        vectors = get_vectors([[("a b", 1)], [("a c", 1)], []])
+        self.assertAlmostEqual((vectors[0] @ vectors[0].T)[0, 0], 1)
+        self.assertEqual(vectors[2].nnz, 0)
+        similarity = (vectors[0] @ vectors[1].T)[0, 0]
+        self.assertTrue(0 < similarity < 1)
+
+    def test_rebuild(self):
+        self.assertEqual(rebuild_similar_products(2, 0.05), 4)
+        self.assertEqual(
+            self.get_similar(self.products[0]),
+            [self.products[1].id, self.products[2].id],
+        )
+        self.assertEqual(self.get_similar(self.products[3]), [])
+
+    def test_update(self):
+        rebuild_similar_products(1, 0.05)
+        self.assertEqual(
+            self.get_similar(self.products[2]), [self.products[0].id]
+        )
+        product = Product.objects.create(
+            name="Цейлонський чорний чай", slug="p-4", price=1
+        )
+        self.assertEqual(self.get_similar(product), [])
+        # only the new product is vectorised
+        with mock.patch(
+            "shop.similarity.get_documents", wraps=get_documents
+        ) as documents:
+            # the new product and the product it is the most similar to
+            self.assertEqual(update_similar_products(product.id, 1, 0.05), 2)
+        documents.assert_called_once_with([product.id])
+        self.assertEqual(self.get_similar(product), [self.products[2].id])
+        self.assertEqual(self.get_similar(self.products[2]), [product.id])
+
+    def test_update_without_model(self):
+        # everything is rebuilt when the vectors are not cached
+        self.assertEqual(
+            update_similar_products(self.products[0].id, 2, 0.05), 4
+        )
+        self.assertEqual(
+            self.get_similar(self.products[0]),
+            [self.products[1].id, self.products[2].id],
+        )
+
+    def test_update_deleted(self):
+        rebuild_similar_products(2, 0.05)
+        product_id = self.products[1].id
+        self.products[1].delete()
+        self.assertEqual(update_similar_products(product_id, 2, 0.05), 0)
+        self.assertNotIn(product_id, cache.get("similarity:model")["ids"])
+
+    def test_updated_when_saved(self):
+        product = self.products[0]
+        with mock.patch(
+            "shop.signals.update_similar_products.apply_async"
+        ) as apply_async, self.captureOnCommitCallbacks(execute=True):
+            product.set_current_language("en")
+            product.name = "Green tea"
+            product.save()
+            product.set_current_language("uk")
+            product.description = "Зелений чай"
+            product.save()
+        # the saves are refreshed together
+        apply_async.assert_called_once_with(
+            (product.id,), countdown=settings.SIMILAR_PRODUCTS_UPDATE_DELAY
+        )
+
+    def test_updated_again_after_the_task_ran(self):
+        product = self.products[0]
+        with mock.patch(
+            "shop.signals.update_similar_products.apply_async"
+        ) as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.name = "Зелений чай улун"
+                product.save()
+            update_similar_products_task(product.id)
+            with self.captureOnCommitCallbacks(execute=True):
+                product.name = "Улун"
+                product.save()
+        # the task released the pending key, the second edit is not dropped
+        self.assertEqual(apply_async.call_count, 2)
+
+    def test_not_updated_when_text_is_unchanged(self):
+        with mock.patch(
+            "shop.signals.update_similar_products.apply_async"
+        ) as apply_async, self.captureOnCommitCallbacks(execute=True):
+            self.products[0].price = 2
+            self.products[0].save()
+        apply_async.assert_not_called()
+
+    @override_settings(RECOMMENDER_STORAGE=MEMORY_STORAGE)
+    def test_fill_recommendations(self):
+        get_purchase_storage.cache_clear()
+        self.addCleanup(get_purchase_storage.cache_clear)
+        recommendations.clear()
+        self.addCleanup(recommendations.clear)
+        rebuild_similar_products(3, 0.05)
+        recommender = Recommender()
+        recommender.products_bought([self.products[0], self.products[3]])
+        self.assertEqual(
+            recommender.suggest_products_for([self.products[0]], 3),
+            [self.products[3], self.products[1], self.products[2]],
+        )
+
+
+class CopurchasesTestCase(TestCase):
+    rows = [
+        (1, 1, 1.0),
+        (1, 2, 1.0),
+        (1, 3, 1.0),
+        (2, 1, 1.0),
+        (2, 2, 1.0),
+        (2, 2, 1.0),
+        (3, 4, 1.0),
+        (4, 1, 1.0),
+    ]
+
+    def test_batches_give_the_same_counts(self):
+        expected = count_copurchases(self.rows, 5).toarray()
+        self.assertEqual(expected[1].tolist(), [0, 0, 2, 1, 0])
+        self.assertEqual(expected[3].tolist(), [0, 1, 1, 0, 0])
+        self.assertEqual(expected[4].tolist(), [0, 0, 0, 0, 0])
+        for batch_size in (1, 2, 3):
+            matrix = count_copurchases(self.rows, 5, batch_size)
+            self.assertEqual(matrix.toarray().tolist(), expected.tolist())
+
+    def test_weights(self):
+        rows = [(1, 1, 0.25), (1, 2, 0.25), (2, 1, 1.0), (2, 2, 1.0)]
+        matrix = count_copurchases(rows, 3, 1)
+        self.assertEqual(matrix[1, 2], 1.25)
+        self.assertEqual(get_weight(120, 60), 0.25)
+        self.assertEqual(get_weight(120, None), 1.0)
+
+    def test_top(self):
+        matrix = count_copurchases(self.rows, 5)
+        top = dict(iter_top(matrix, 1))
+        self.assertEqual(top, {1: [(2, 2.0)], 2: [(1, 2.0)], 3: [(2, 1.0)]})
+
+    @mock.patch("shop.recommender.Recommender.load_purchases", return_value=3)
+    def test_rebuild_command(self, load_purchases):
+        products = [
+            Product.objects.create(name=f"Product {i}", slug=f"p-{i}", price=1)
+            for i in range(3)
+        ]
+        for paid in (True, True, False):
+            order = Order.objects.create(
+                first_name="Olena",
+                last_name="Shevchenko",
+                email="o@example.com",
+                address="Khreshchatyk 1",
+                postal_code="01001",
+                city="Kyiv",
+                paid=paid,
+            )
+            for product in products[:2] if paid else products:
+                OrderItem.objects.create(order=order, product=product, price=1)
+        with mock.patch("shop.recommender.Recommender.set_decayed_at"):
+            call_command("rebuild_recommendations", stdout=mock.Mock())
+        # the top scores are streamed to the storage, not collected first
+        self.assertTrue(inspect.isgenerator(load_purchases.call_args.args[0]))
+        scores = dict(load_purchases.call_args.args[0])
+        self.assertEqual(
+            scores,
+            {
+                products[0].id: [(products[1].id, 2.0)],
+                products[1].id: [(products[0].id, 2.0)],
+                products[2].id: None,
+            },
+        )
+
+
+class RecommendationsReportTestCase(TestCase):
+    @mock.patch("shop.recommender.Recommender.iter_purchase_sizes")
+    def test_report(self, iter_purchase_sizes):
+        iter_purchase_sizes.return_value = [
+            ("product:1:purchased_with", 3, 200),
+            ("product:2:purchased_with", 100, 4096),
+            ("product:3:purchased_with", 1, 100),
+        ]
+        stdout = io.StringIO()
+        call_command("recommendations_report", largest=2, stdout=stdout)
+        self.assertEqual(
+            stdout.getvalue().splitlines(),
+            [
+                "Keys: 3",
+                "Members: 104",
+                "Members per key: 34.7",
+                "Memory: 4,396 bytes",
+                "Largest keys:",
+                "  product:2:purchased_with: 100 members, 4,096 bytes",
+                "  product:1:purchased_with: 3 members, 200 bytes",
+            ],
+        )
+
+
+class ClearRecommendationsTestCase(TestCase):
+    @mock.patch("shop.recommender.Recommender.clear_purchases", return_value=4)
+    def test_clear_category(self, clear_purchases):
+        category = Category.objects.create(name="Чай", slug="chai")
+        products = [
+            Product.objects.create(
+                name=f"Product {i}",
+                slug=f"p-{i}",
+                price=1,
+                category=category if i else None,
+            )
+            for i in range(3)
+        ]
+        stdout = io.StringIO()
+        call_command("clear_recommendations", category="chai", stdout=stdout)
+        self.assertCountEqual(
+            clear_purchases.call_args.args[0],
+            [product.id for product in products[1:]],
+        )
+        self.assertEqual(
+            stdout.getvalue(), "Cleared the scores of 4 products.\n"
+        )
+
+
+class BenchmarkRecommendationsTestCase(TestCase):
+    def test_benchmark(self):
+        stdout = io.StringIO()
+        call_command(
+            "benchmark_recommendations",
+            storage=[MEMORY_STORAGE],
+            products=20,
+            orders=10,
+            reads=10,
+            stdout=stdout,
+        )
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[0], MEMORY_STORAGE)
+        self.assertTrue(lines[1].startswith("  record: 10 calls in "))
+        self.assertTrue(lines[2].startswith("  get_top: 10 calls in "))
@@ -7,6 +7,16 @@ app_name = "shop"
 urlpatterns = [
     path("", views.product_list, name="product_list"),
     path("search/", views.products_search, name="products_search"),
+    path(
+        "search/suggest/",
+        views.products_suggest,
+        name="products_suggest",
+    ),
+    path(
+        "recommender/metrics/",
+        views.recommender_metrics,
+        name="recommender_metrics",
+    ),
     path(
         "<slug:category_slug>/",
         views.product_list,
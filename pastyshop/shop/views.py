@@ -1,16 +1,15 @@
-import random
-
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.contrib.postgres.search import (
-    SearchVector,
-    SearchQuery,
-    SearchRank,
-)
 
 from cart.forms import CartAddProductForm
 from .models import Category, Product
-from .recommender import Recommender
+from .pagination import KeysetPaginator, RankedListPaginator, InvalidCursor
+from .recommender import Recommender, breaker, recommendations
+from .search import get_products, get_search_backend
+from .showcase import Showcase
 from .forms import ProductFilterForm, SearchForm, CommentForm
 
 
@@ -31,39 +30,56 @@ def product_list(request, category_slug=None):
     if filter_form.is_valid():
         orderby = filter_form.cleaned_data["orderby"]
 
+    language = request.LANGUAGE_CODE
     category = None
-    categories = Category.objects.all()
-    all_products = (
-        Product.objects.filter(available=True).order_by("?").distinct()
-    )
-
-    # Apply sorting based on the selected option
-    if orderby:
-        all_products = filter_form.apply_sorting(all_products)
-
-    total_products_count = all_products.count()
-
-    # Pagination with 2 products per page
-    paginator = Paginator(all_products, 9)
-    page_number = request.GET.get("page", 1)
-    try:
-        products = paginator.page(page_number)
-    except PageNotAnInteger:
-        # If page_number is not an integer, deliver the first page
-        products = paginator.page(1)
-    except EmptyPage:
-        # If page_number is out of range, deliver the last page of results
-        products = paginator.page(paginator.num_pages)
-
+    categories = Category.objects.prefetch_translations()
     if category_slug:
-        language = request.LANGUAGE_CODE
         category = get_object_or_404(
-            Category,
+            Category.objects.prefetch_translations(),
             translations__language_code=language,
             translations__slug=category_slug,
         )
-        products = all_products.filter(category=category)
-        total_products_count = products.count()
+
+    showcase = Showcase()
+    category_id = category.id if category else None
+    ordering = filter_form.get_ordering() if orderby else None
+
+    if ordering:
+        # Keyset pagination on the sort key, the total comes from the
+        # cached showcase pool instead of a COUNT on every request, so the
+        # pages hold the same products as the pool
+        all_products = Product.objects.prefetch_translations().filter(
+            available=True, translations__language_code=language
+        )
+        if category:
+            all_products = all_products.filter(category=category)
+        total_products_count = len(showcase.get_pool(language, category_id))
+        paginator = KeysetPaginator(
+            all_products, ordering, 9, count=total_products_count
+        )
+        try:
+            products = paginator.page(request.GET.get("cursor"))
+        except InvalidCursor:
+            # If the cursor is malformed, deliver the first page
+            products = paginator.page()
+    else:
+        # Page through the shuffled id pool instead of ORDER BY RANDOM()
+        all_products = showcase.get_pool(language, category_id)
+        total_products_count = len(all_products)
+
+        # Pagination with 9 products per page
+        paginator = Paginator(all_products, 9)
+        page_number = request.GET.get("page", 1)
+        try:
+            products = paginator.page(page_number)
+        except PageNotAnInteger:
+            # If page_number is not an integer, deliver the first page
+            products = paginator.page(1)
+        except EmptyPage:
+            # If page_number is out of range, deliver the last page of results
+            products = paginator.page(paginator.num_pages)
+        # load only the products of the current page
+        products.object_list = showcase.get_products(products.object_list)
 
     return render(
         request,
@@ -95,7 +111,9 @@ def product_detail(request, id, slug):
 
     language = request.LANGUAGE_CODE
     product = get_object_or_404(
-        Product,
+        Product.objects.select_related("category").prefetch_translations(
+            "category"
+        ),
         id=id,
         translations__language_code=language,
         translations__slug=slug,
@@ -105,10 +123,9 @@ def product_detail(request, id, slug):
 
     r = Recommender()
     recommended_products = r.suggest_products_for([product], 4)
-    if recommended_products.count == 0:
-        all_products = Product.objects.filter(available=True)
-        recommended_products = random.sample(
-            list(all_products), min(len(all_products), 5)
+    if not recommended_products:
+        recommended_products = Showcase().sample_bestsellers(
+            language, 5, product.category_id, exclude=[product.id]
         )
 
     if request.method == "POST":
@@ -118,23 +135,22 @@ def product_detail(request, id, slug):
             comment = comment_form.save(commit=False)
             comment.product = product
             comment.save()
+            product.refresh_from_db(fields=["active_comment_count"])
     comment_form = CommentForm()
 
     # comments = Comment.objects.filter(product=product, active=True)
     comments = product.comments.filter(active=True)
-    total_comments_count = len(comments)
+    total_comments_count = product.active_comment_count
 
-    # Pagination with 2 comments per page
-    paginator = Paginator(comments, 3)
-    page_number = request.GET.get("page", 1)
+    # Keyset pagination on (created, id) with 3 comments per page
+    paginator = KeysetPaginator(
+        comments, ["created", "id"], 3, count=total_comments_count
+    )
     try:
-        comments = paginator.page(page_number)
-    except PageNotAnInteger:
-        # If page_number is not an integer, deliver the first page
-        comments = paginator.page(1)
-    except EmptyPage:
-        # If page_number is out of range, deliver the last page of results
-        comments = paginator.page(paginator.num_pages)
+        comments = paginator.page(request.GET.get("cursor"))
+    except InvalidCursor:
+        # If the cursor is malformed, deliver the first page
+        comments = paginator.page()
 
     return render(
         request,
@@ -156,8 +172,10 @@ def products_search(request):
     to search for products.
     It uses the SearchForm form, which contains a single field named query.
     The user's input
-    is stored in the query variable and then used to filter Product objects
-    using Django's SearchVector and SearchQuery classes.
+    is stored in the query variable and then passed to the search backend
+    picked by the SEARCH_BACKEND setting. Results are ordered by their rank
+    and paginated by (rank, id), or capped to the top few results when top
+    is set.
 
     :param request: Get the request object
     :return: A rendered template, but it also contains a
@@ -170,32 +188,37 @@ def products_search(request):
         form = SearchForm(request.GET)
         if form.is_valid():
             query = form.cleaned_data["query"]
-            search_vector = (
-                SearchVector("translations__name", weight="A")
-                + SearchVector("translations__description", weight="B")
-                + SearchVector("translations__mini_description", weight="B")
+            search_results = get_search_backend().search(
+                query, request.LANGUAGE_CODE
             )
-            search_query = SearchQuery(query)
-
-            products = Product.objects.filter(available=True)
-
-            results = (
-                products.annotate(
-                    search=search_vector,
-                    rank=SearchRank(search_vector, search_query),
+            if form.cleaned_data["top"]:
+                # capped top results for the header search box
+                results = get_products(
+                    search_results[: settings.SEARCH_TOP_RESULTS]
                 )
-                .filter(search=search_query)
-                .order_by("-updated")
-            )
-    try:
+            else:
+                # Keyset pagination on (rank, id) with 9 products per page
+                paginator = RankedListPaginator(
+                    search_results, ["-rank", "-id"], 9
+                )
+                try:
+                    results = paginator.page(request.GET.get("cursor"))
+                except InvalidCursor:
+                    # If the cursor is malformed, deliver the first page
+                    results = paginator.page()
+                # load only the products of the current page
+                results.object_list = get_products(results.object_list)
+
+    recommended_products = []
+    found_products = list(results)[:4]
+    if found_products:
         r = Recommender()
-        recommended_products = r.suggest_products_for([products], 4)
-    except ValueError:
-        recommended_products = []
+        recommended_products = r.suggest_products_for(found_products, 4)
     if len(recommended_products) == 0:
-        all_products = Product.objects.filter(available=True)
-        recommended_products = random.sample(
-            list(all_products), min(len(all_products), 4)
+        recommended_products = Showcase().sample_bestsellers(
+            request.LANGUAGE_CODE,
+            4,
+            exclude=[product.id for product in found_products],
         )
 
     return render(
@@ -208,3 +231,39 @@ def products_search(request):
             "recommended_products": recommended_products,
         },
     )
+
+
+def products_suggest(request):
+    """
+    The products_suggest function is a JSON endpoint for the autocomplete
+    of the search box. It returns the products and categories whose names start
+    with or look like the query, so it is cheap enough to be called on every
+    keystroke and still finds something for a misspelled name.
+
+    :param request: Get the query from the request
+    :return: A JSON response with product and category suggestions
+    """
+    query = request.GET.get("query", "").strip()
+    if len(query) < 2:
+        return JsonResponse({"products": [], "categories": []})
+    return JsonResponse(
+        get_search_backend().suggest(
+            query, request.LANGUAGE_CODE, settings.SEARCH_TOP_RESULTS
+        )
+    )
+
+
+@staff_member_required
+def recommender_metrics(request):
+    """
+    The recommender_metrics function is a JSON endpoint with the state of
+    the circuit breaker in front of the recommender storage, how often the
+    snapshot was read instead, and the hits of the recommendation cache.
+    The numbers are those of the process that answers the request.
+
+    :param request: Get the current request
+    :return: A JSON response with the breaker and cache metrics
+    """
+    return JsonResponse(
+        {"breaker": breaker.info(), "cache": recommendations.info()}
+    )